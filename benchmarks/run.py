@@ -0,0 +1,185 @@
+"""Runs a synthetic world against offline models and reports how fast it steps.
+
+    poetry run benchmark --agents 10 --locations 4 --memories 50 --steps 20
+"""
+import argparse
+import asyncio
+import contextlib
+import inspect
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+from collections import defaultdict
+
+os.environ["DATABASE_PROVIDER"] = "sqlite"
+# Jitter only spreads out real API calls, it would just add dead time here
+os.environ["SCHEDULER_JITTER"] = "0"
+
+PHASES = {
+    "observe": "observe",
+    "react": "_react",
+    "plan": "_plan",
+    "act": "_act",
+    "reflect": "_reflect",
+}
+
+
+class Timings:
+    """Collects durations of wrapped coroutines, grouped by label"""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    def wrap(self, owner, name: str, label: str) -> None:
+        original = getattr(owner, name)
+
+        async def timed(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                self.samples[label].append(time.perf_counter() - started_at)
+
+        setattr(owner, name, timed)
+
+    def summary(self, label: str) -> dict[str, float]:
+        samples = self.samples.get(label, [])
+        return {
+            "calls": len(samples),
+            "total_seconds": sum(samples),
+            "mean_ms": statistics.mean(samples) * 1000 if samples else 0.0,
+            "p95_ms": (
+                statistics.quantiles(samples, n=20)[-1] * 1000
+                if len(samples) > 1
+                else sum(samples) * 1000
+            ),
+        }
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    from src.agent.base import Agent
+    from src.utils import cache
+    from src.utils.database.client import get_database
+    from src.utils.database.write_behind import write_buffer
+    from src.utils.formatting import set_console_output
+    from src.world.base import World
+
+    from .world import create_synthetic_world
+
+    # Start from an empty chat cache, the offline responses don't need caching
+    cache.cache.clear()
+    # The typing effect sleeps between words, which would swamp the timings
+    set_console_output(args.verbose)
+
+    timings = Timings()
+    for label, name in PHASES.items():
+        timings.wrap(Agent, name, label)
+
+    database = await get_database()
+    for name, method in inspect.getmembers(type(database), inspect.iscoroutinefunction):
+        if not name.startswith("_") and name not in ["create", "close"]:
+            timings.wrap(type(database), name, "db")
+
+    world_id = await create_synthetic_world(
+        args.agents, args.locations, args.memories, seed=args.seed
+    )
+    world = await World.from_id(world_id)
+
+    # Don't count the world setup
+    timings.samples.clear()
+
+    failed_steps = 0
+    started_at = time.perf_counter()
+    for _ in range(args.steps):
+        try:
+            await world.run_step()
+        except Exception:
+            failed_steps += 1
+            traceback.print_exc(file=sys.stderr)
+    elapsed = time.perf_counter() - started_at
+
+    await write_buffer.flush()
+    await database.close()
+
+    return {
+        "agents": args.agents,
+        "locations": args.locations,
+        "memories_per_agent": args.memories,
+        "steps": args.steps,
+        "failed_steps": failed_steps,
+        "seconds": elapsed,
+        "world_steps_per_second": args.steps / elapsed,
+        "agent_steps_per_second": args.steps * args.agents / elapsed,
+        "phases": {label: timings.summary(label) for label in PHASES},
+        "db": timings.summary("db"),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def format_report(results: dict) -> str:
+    lines = [
+        f"{results['agents']} agents, {results['locations']} locations, "
+        f"{results['memories_per_agent']} memories per agent, {results['steps']} steps "
+        f"({results['failed_steps']} failed)",
+        f"Wall time: {results['seconds']:.2f}s",
+        f"Steps/sec: {results['world_steps_per_second']:.3f} world, "
+        f"{results['agent_steps_per_second']:.3f} agent",
+        "",
+        f"{'phase':<10}{'calls':>8}{'total s':>10}{'mean ms':>10}{'p95 ms':>10}",
+    ]
+    # act includes the observe it runs before executing the plan
+    for label, summary in [*results["phases"].items(), ("db", results["db"])]:
+        lines.append(
+            f"{label:<10}{summary['calls']:>8}{summary['total_seconds']:>10.2f}"
+            f"{summary['mean_ms']:>10.1f}{summary['p95_ms']:>10.1f}"
+        )
+    lines += ["", f"Peak RSS: {results['peak_rss_mb']:.1f} MB"]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agents", type=int, default=10)
+    parser.add_argument("--locations", type=int, default=4)
+    parser.add_argument("--memories", type=int, default=50, help="memories per agent")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument(
+        "--verbose", action="store_true", help="show the agents' console output"
+    )
+    args = parser.parse_args()
+
+    # Run against the offline stand-ins for the LLM and embeddings. Their latency
+    # comes from OFFLINE_LLM_LATENCY and OFFLINE_EMBEDDING_LATENCY, zero by default
+    sys.argv.append("--offline")
+
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    # The config is read from the repo root, everything the run writes goes to a scratch directory
+    from src.utils import parameters  # noqa: F401
+
+    scratch_directory = tempfile.mkdtemp(prefix="gpteam-benchmark-")
+    os.chdir(scratch_directory)
+
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(open(os.devnull, "w")))
+        results = asyncio.run(run_benchmark(args))
+
+    print(format_report(results))
+    print(f"Database and progress files are in {scratch_directory}")
+
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
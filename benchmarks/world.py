@@ -0,0 +1,97 @@
+import random
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytz
+
+from src.memory.base import MemoryType, SingleMemory
+from src.utils.database.base import Tables
+from src.utils.database.client import get_database
+from src.utils.offline_model import offline_embedding
+
+FIRST_NAMES = ["Ada", "Basil", "Cora", "Dmitri", "Elif", "Farid", "Greta", "Hugo"]
+
+
+async def create_synthetic_world(
+    num_agents: int, num_locations: int, num_memories: int, seed: int = 0
+) -> str:
+    """Inserts a world with generated locations, agents, initial plans and memories.
+
+    Returns the world's id.
+    """
+    rng = random.Random(seed)
+    database = await get_database()
+    now = datetime.now(pytz.utc)
+
+    world_id = str(uuid4())
+    await database.insert(
+        Tables.Worlds, {"id": world_id, "name": f"Benchmark {now:%Y-%m-%d %H:%M}"}
+    )
+
+    agent_ids = [str(uuid4()) for _ in range(num_agents)]
+
+    locations = [
+        {
+            "id": str(uuid4()),
+            "world_id": world_id,
+            "name": f"Room {index}",
+            "description": f"Room number {index}, where people argue about what to do next",
+            "channel_id": None,
+            "allowed_agent_ids": agent_ids,
+            "available_tools": [],
+        }
+        for index in range(1, num_locations + 1)
+    ]
+    await database.insert(Tables.Locations, locations)
+
+    for index, agent_id in enumerate(agent_ids):
+        first_name = FIRST_NAMES[index % len(FIRST_NAMES)]
+        full_name = (
+            first_name
+            if index < len(FIRST_NAMES)
+            else f"{first_name}{index // len(FIRST_NAMES)}"
+        )
+        location = rng.choice(locations)
+        plan_id = str(uuid4())
+
+        await database.insert(
+            Tables.Agents,
+            {
+                "id": agent_id,
+                "full_name": full_name,
+                "private_bio": f"{full_name} wants the group to commit to a decision today.",
+                "public_bio": f"{full_name} is impatient with long debates.",
+                "directives": ["Get the others to commit to something"],
+                "authorized_tools": [],
+                "ordered_plan_ids": [plan_id],
+                "world_id": world_id,
+                "location_id": location["id"],
+                "discord_bot_token": None,
+            },
+        )
+
+        await database.insert(
+            Tables.Plans,
+            {
+                "id": plan_id,
+                "agent_id": agent_id,
+                "description": "Find out what the others in the room are planning",
+                "max_duration_hrs": 1,
+                "stop_condition": "Everyone in the room has said what they will do",
+                "location_id": location["id"],
+            },
+        )
+
+        for memory_index in range(num_memories):
+            description = f"{full_name} noticed thing {memory_index} in {location['name']}"
+            memory = SingleMemory(
+                agent_id=agent_id,
+                type=MemoryType.OBSERVATION,
+                description=description,
+                importance=rng.randint(1, 5),
+                embedding=offline_embedding(description),
+                created_at=now - timedelta(minutes=num_memories - memory_index),
+            )
+            await database.insert(Tables.Memories, memory.db_dict())
+
+    return world_id
@@ -1,7 +1,8 @@
 import asyncio
+import copy
 import json
 import os
-import random
+import time
 from ctypes import Union
 from datetime import datetime, timedelta
 from typing import Literal, Optional, Type, cast
@@ -12,10 +13,11 @@ import pytz
 from colorama import Fore
 from langchain.output_parsers import OutputFixingParser, PydanticOutputParser
 from langchain.schema import AIMessage, HumanMessage
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 from src.utils.database.base import Tables
 from src.utils.database.client import get_database
+from src.utils.database.write_behind import write_buffer
 from src.utils.discord import announce_bot_move
 from src.utils.logging import agent_logger
 
@@ -31,10 +33,15 @@ from ..utils.formatting import print_to_console
 from ..utils.model_name import ChatModelName
 from ..utils.models import ChatModel
 from ..utils.parameters import (
+    ACTIVITY_SUMMARY_MAX_AGE,
     DEFAULT_SMART_MODEL,
     DEFAULT_WORLD_ID,
     DISCORD_ENABLED,
+    LAST_CHECKED_EVENTS_INTERVAL,
     PLAN_LENGTH,
+    PROGRESS_FILE_INTERVAL,
+    PROGRESS_FILE_MEMORIES,
+    PROGRESS_FILES,
     REFLECTION_MEMORY_COUNT,
 )
 from ..utils.prompt import Prompter, PromptString
@@ -51,7 +58,12 @@ from .plans import LLMPlanResponse, LLMSinglePlan, PlanStatus, SinglePlan
 from .react import LLMReactionResponse, Reaction
 from .reflection import ReflectionQuestions, ReflectionResponse
 
-SUMMARIZE_ACTIVITY_INTERVAL = 20  # seconds
+
+
+def _write_file(file_path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(text)
 
 
 class Agent(BaseModel):
@@ -73,6 +85,16 @@ class Agent(BaseModel):
     discord_bot_token: str = None
     react_response: LLMReactionResponse = None
     recent_activity: str = ""
+    # The agent row as last written to the DB
+    _persisted_row: dict = PrivateAttr(default_factory=dict)
+    _last_checked_events_written_at: Optional[float] = PrivateAttr(default=None)
+    _progress_written_at: Optional[float] = PrivateAttr(default=None)
+    # Progress file lines of the memories listed last time, by memory id
+    _memory_lines: dict[UUID, str] = PrivateAttr(default_factory=dict)
+    # Number of memories and the latest memory's id when recent_activity was summarized
+    _summarized_memories: Optional[tuple[int, Optional[UUID]]] = PrivateAttr(
+        default=None
+    )
 
     class Config:
         allow_underscore_names = True
@@ -143,35 +165,43 @@ class Agent(BaseModel):
         return f"{self.full_name} - {self.location.name}\nprivate_bio: {private_bio}\nDirectives: {self.directives}\n\nRecent Memories: \n{memories}\n\nPlans: \n{plans}\n"
 
     @property
-    async def allowed_locations(self) -> list[Location]:
-        """Get locations that this agent is allowed to be in."""
-        database = await get_database()
-        data = await database.get_by_field_contains(
-            Tables.Locations, "allowed_agent_ids", str(self.id)
-        )
-
-        # For testing purposes include locations with 0 allowed agents as well
-        other_data = await database.get_by_field(
-            Tables.Locations, "allowed_agent_ids", "{}"
-        )
-
-        return [Location(**location) for location in data + other_data]
+    def allowed_locations(self) -> dict[str, Location]:
+        """Get locations that this agent is allowed to be in, by name."""
+        return self.context.get_allowed_locations(self.id)
 
     @classmethod
     async def from_db_dict(
-        cls, agent_dict: dict, locations: list[Location], context: WorldContext
+        cls,
+        agent_dict: dict,
+        locations: list[Location],
+        context: WorldContext,
+        plans_data: Optional[list[dict]] = None,
+        memories_data: Optional[list[dict]] = None,
+        related_events: Optional[dict[str, Event]] = None,
     ):
-        """Create an agent from a dictionary retrieved from the database."""
+        """Create an agent from a dictionary retrieved from the database.
+
+        The agent's plan and memory rows and its plans' related events are fetched
+        unless they are passed in, e.g. by World.from_id, which loads them for all agents at once.
+        """
         database = await get_database()
-        plans = await database.get_by_ids(Tables.Plans, agent_dict["ordered_plan_ids"])
+        if plans_data is None:
+            plans_data = await database.get_by_ids(
+                Tables.Plans, agent_dict["ordered_plan_ids"]
+            )
 
         ordered_plans: list[dict] = sorted(
-            plans, key=lambda plan: agent_dict["ordered_plan_ids"].index(plan["id"])
+            plans_data,
+            key=lambda plan: agent_dict["ordered_plan_ids"].index(plan["id"]),
         )
 
-        memories_data = await database.get_by_field(
-            Tables.Memories, "agent_id", str(agent_dict["id"])
-        )
+        if memories_data is None:
+            memories_data = await database.get_by_field(
+                Tables.Memories, "agent_id", str(agent_dict["id"])
+            )
+
+        if related_events is None:
+            related_events = {}
 
         plans = []
         for plan in ordered_plans:
@@ -181,11 +211,12 @@ class Agent(BaseModel):
                 if str(location.id) == plan["location_id"]
             ][0]
 
-            related_event = (
-                await Event.from_id(plan["related_event_id"])
-                if plan["related_event_id"] is not None
-                else None
-            )
+            related_event_id = plan["related_event_id"]
+            related_event = None
+            if related_event_id is not None:
+                related_event = related_events.get(
+                    str(related_event_id)
+                ) or await Event.from_id(related_event_id)
             related_message = (
                 AgentMessage.from_event(related_event, context)
                 if related_event
@@ -209,7 +240,7 @@ class Agent(BaseModel):
             if str(location.id) == agent_dict["location_id"]
         ][0]
 
-        return cls(
+        agent = cls(
             id=agent_dict["id"],
             full_name=agent_dict["full_name"],
             private_bio=agent_dict["private_bio"],
@@ -224,6 +255,13 @@ class Agent(BaseModel):
             discord_bot_token=agent_dict["discord_bot_token"],
         )
 
+        # Everything was just loaded, so only later changes need writing
+        agent.mark_persisted()
+        for plan in agent.plans:
+            plan.mark_persisted()
+
+        return agent
+
     @classmethod
     async def from_id(cls, id: UUID, context: WorldContext):
         database = await get_database()
@@ -304,50 +342,114 @@ class Agent(BaseModel):
     def color(self) -> LogColor:
         return self.context.get_agent_color(self.id)
 
-    async def _add_memory(
+    async def _make_memory(
         self,
         description: str,
-        created_at: datetime = datetime.now(),
+        created_at: Optional[datetime] = None,
         type: MemoryType = MemoryType.OBSERVATION,
         related_memory_ids: list[UUID] = [],
-        log: bool = True,
     ) -> SingleMemory:
-        memory = SingleMemory(
+        if created_at is None:
+            created_at = self.context.clock.now()
+
+        # The importance rating and the embedding don't depend on each other
+        importance, embedding = await asyncio.gather(
+            self._calculate_importance(description), get_embedding(description)
+        )
+
+        return SingleMemory(
             agent_id=self.id,
             type=type,
             description=description,
-            importance=await self._calculate_importance(description),
-            embedding=await get_embedding(description),
+            importance=importance,
+            embedding=embedding,
             related_memory_ids=related_memory_ids,
             created_at=created_at,
         )
 
+    async def _add_memory(
+        self,
+        description: str,
+        created_at: Optional[datetime] = None,
+        type: MemoryType = MemoryType.OBSERVATION,
+        related_memory_ids: list[UUID] = [],
+        log: bool = True,
+    ) -> SingleMemory:
+        memory = await self._make_memory(
+            description,
+            created_at=created_at,
+            type=type,
+            related_memory_ids=related_memory_ids,
+        )
+        return await self._save_memory(memory, log=log)
+
+    async def _save_memory(self, memory: SingleMemory, log: bool = True) -> SingleMemory:
         self.memories.append(memory)
 
         # add to database
-        await (await get_database()).insert(Tables.Memories, memory.db_dict())
+        await write_buffer.insert(Tables.Memories, memory.db_dict())
 
         if log:
             self._log("New Memory", f"{memory}")
 
         return memory
 
-    async def _update_agent_row(self):
-        row = {
+    def _agent_row(self) -> dict:
+        return {
             "full_name": self.full_name,
             "private_bio": self.private_bio,
             "directives": self.directives,
             "location_id": str(self.location.id),
-            "last_checked_events": self.last_checked_events.isoformat(),
             "ordered_plan_ids": [str(plan.id) for plan in self.plans],
         }
 
-        return await (await get_database()).update(Tables.Agents, str(self.id), row)
+    def mark_persisted(self) -> None:
+        self._persisted_row = copy.deepcopy(self._agent_row())
+        self._persisted_row["last_checked_events"] = self.last_checked_events.isoformat()
+        self._last_checked_events_written_at = time.monotonic()
+
+    async def _update_agent_row(self, force: bool = False):
+        """Writes the fields of the agent row that changed since the last write.
+
+        last_checked_events moves on every step, so on its own it is only written every
+        LAST_CHECKED_EVENTS_INTERVAL seconds, or when force is set, e.g. when the run stops.
+        """
+        row = {
+            key: value
+            for key, value in self._agent_row().items()
+            if key not in self._persisted_row or self._persisted_row[key] != value
+        }
+
+        last_checked_events = self.last_checked_events.isoformat()
+        now = time.monotonic()
+        if last_checked_events != self._persisted_row.get("last_checked_events") and (
+            row
+            or force
+            or self._last_checked_events_written_at is None
+            or now - self._last_checked_events_written_at >= LAST_CHECKED_EVENTS_INTERVAL
+        ):
+            row["last_checked_events"] = last_checked_events
+            self._last_checked_events_written_at = now
+
+        if not row:
+            return
+
+        self._persisted_row.update(copy.deepcopy(row))
+        return await write_buffer.update(Tables.Agents, str(self.id), row)
 
     async def _upsert_plan_rows(self, plans: list[SinglePlan]):
-        database = await get_database()
         for plan in plans:
-            await database.insert(Tables.Plans, plan._db_dict(), upsert=True)
+            changed = plan.dirty_fields()
+            if not changed:
+                continue
+
+            # Plans that were written before only need their changed fields
+            is_new = not plan._persisted_row
+            plan.mark_persisted(changed)
+            if is_new:
+                await write_buffer.upsert(Tables.Plans, plan._db_dict())
+            else:
+                await write_buffer.update(Tables.Plans, str(plan.id), dict(changed))
 
     def update_plan(self, new_plan: SinglePlan):
         old_plan = [
@@ -359,28 +461,23 @@ class Agent(BaseModel):
             plan if plan.id is not old_plan.id else new_plan for plan in self.plans
         ]
 
-    async def _get_memories_since(self, date: datetime):
-        data = await (await get_database()).get_memories_since(date, str(self.id))
-        memories = [SingleMemory(**memory) for memory in data]
-        return memories
-
     async def _should_reflect(self) -> bool:
         """Check if the agent should reflect on their memories.
         Returns True if the cumulative importance score of memories
-        since the last reflection is over 100
+        since the last reflection is over 500
         """
-        data = await (await get_database()).get_should_reflect(str(self.id))
-
-        last_reflection_time = (
-            data[0]["created_at"] if len(data) > 0 else datetime(1970, 1, 1)
-        )
-
-        memories_since_last_reflection = await self._get_memories_since(
-            last_reflection_time
-        )
+        # Worked out from the memories in hand, the latest ones may not be written yet
+        reflection_times = [
+            memory.created_at
+            for memory in self.memories
+            if memory.type == MemoryType.REFLECTION
+        ]
+        last_reflection_time = max(reflection_times, default=None)
 
         cumulative_importance = sum(
-            [memory.importance for memory in memories_since_last_reflection]
+            memory.importance
+            for memory in self.memories
+            if last_reflection_time is None or memory.created_at > last_reflection_time
         )
 
         return cumulative_importance > 500
@@ -399,13 +496,38 @@ class Agent(BaseModel):
             "discord_bot_token": self.discord_bot_token,
         }
 
+    async def _get_recent_activity(self) -> str:
+        """Summarizes the recent activity, reusing the last summary until new memories
+        arrive or it is older than ACTIVITY_SUMMARY_MAX_AGE"""
+        memories_key = (
+            len(self.memories),
+            self.memories[-1].id if self.memories else None,
+        )
+        summary_age = (
+            self.context.clock.now() - self.last_summarized_activity
+        ).total_seconds()
+
+        if (
+            memories_key == self._summarized_memories
+            and summary_age <= ACTIVITY_SUMMARY_MAX_AGE
+        ):
+            return self.recent_activity
+
+        recent_activity = await self._summarize_activity()
+
+        self.last_summarized_activity = self.context.clock.now()
+        self._summarized_memories = memories_key
+
+        return recent_activity
+
     async def _summarize_activity(self, k: int = 20) -> str:
         recent_memories = sorted(
             self.memories, key=lambda memory: memory.created_at, reverse=True
         )[:k]
 
         if len(recent_memories) == 0:
-            return "I haven't done anything recently."
+            self.recent_activity = "I haven't done anything recently."
+            return self.recent_activity
 
         summary_prompter = Prompter(
             PromptString.RECENT_ACTIIVITY,
@@ -490,7 +612,7 @@ class Agent(BaseModel):
 
         self._log(
             "Moved Location",
-            f"{self.location.name} -> {location.name} @ {datetime.now(pytz.utc).strftime('%H:%M:%S')}",
+            f"{self.location.name} -> {location.name} @ {self.context.clock.now().strftime('%H:%M:%S')}",
         )
 
         departure_event = Event(
@@ -498,7 +620,7 @@ class Agent(BaseModel):
             description=f"{self.full_name} left the {old_location.name}",
             location_id=old_location.id,
             agent_id=self.id,
-            timestamp=datetime.now(pytz.utc),
+            timestamp=self.context.clock.now(),
         )
 
         arrival_event = Event(
@@ -506,7 +628,7 @@ class Agent(BaseModel):
             description=f"{self.full_name} arrived at the {location.name}",
             location_id=location.id,
             agent_id=self.id,
-            timestamp=datetime.now(pytz.utc),
+            timestamp=self.context.clock.now(),
         )
 
         # Update the local agent, do we need both of these lines?
@@ -566,7 +688,9 @@ class Agent(BaseModel):
         # For each question in the parsed questions...
         for question in parsed_questions_response.questions:
             # Get the related memories
-            related_memories = await get_relevant_memories(question, self.memories, 20)
+            related_memories = await get_relevant_memories(
+                question, self.memories, self.context.clock.now(), 20
+            )
 
             # Format them into a string
             memory_strings = [
@@ -654,10 +778,13 @@ class Agent(BaseModel):
 
         event = Event(
             agent_id=self.id,
+            timestamp=self.context.clock.now(),
             type=EventType.MESSAGE,
             subtype=MessageEventSubtype.AGENT_TO_AGENT,
             description=f"{self.full_name} said to everyone in the {self.location.name}: '{response}'",
             location_id=self.location.id,
+            sender_id=self.id,
+            content=response,
         )
 
         await self.context.add_event(event)
@@ -682,12 +809,8 @@ class Agent(BaseModel):
         )
 
         # Get a summary of the recent activity
-        if (
-            datetime.now(pytz.utc) - self.last_summarized_activity
-        ).total_seconds() > SUMMARIZE_ACTIVITY_INTERVAL:
-            recent_activity = await self._summarize_activity()
-        else:
-            recent_activity = self.recent_activity
+        recent_activity = await self._get_recent_activity()
+        allowed_locations = self.allowed_locations
 
         self._log("Recent Activity Summary", recent_activity)
 
@@ -698,7 +821,7 @@ class Agent(BaseModel):
                 "time_window": PLAN_LENGTH,
                 "allowed_location_descriptions": [
                     f"'uuid: {location.id}, name: {location.name}, description: {location.description}\n"
-                    for location in await self.allowed_locations
+                    for location in allowed_locations.values()
                 ],
                 "full_name": self.full_name,
                 "private_bio": self.private_bio,
@@ -729,7 +852,7 @@ class Agent(BaseModel):
             plan.location_name
             for plan in parsed_plans_response.plans
             if plan.location_name
-            not in [location.name for location in await self.allowed_locations]
+            not in allowed_locations
         ]
 
         if invalid_locations:
@@ -762,27 +885,19 @@ class Agent(BaseModel):
         for plan in parsed_plans_response.plans:
             new_plan = SinglePlan(
                 description=plan.description,
-                location=next(
-                    (
-                        location
-                        for location in await self.allowed_locations
-                        if str(location.name) == str(plan.location_name)
-                    ),
-                    None,
-                ),
+                location=allowed_locations.get(str(plan.location_name)),
                 max_duration_hrs=plan.max_duration_hrs,
                 agent_id=self.id,
                 stop_condition=plan.stop_condition,
+                created_at=self.context.clock.now(),
             )
             new_plans.append(new_plan)
 
         # update the local agent object
         self.plans = new_plans
 
-        # update the db agent row
+        # update the db agent row and add the plans to the plan table
         await self._update_agent_row()
-
-        # add the plans to the plan table
         await self._upsert_plan_rows(new_plans)
 
         # Loop through each plan and print it to the console
@@ -806,13 +921,11 @@ class Agent(BaseModel):
             llm=ChatModel(temperature=0).defaultModel,
         )
 
-        # Get a summary of the recent activity
-        if (
-            datetime.now(pytz.utc) - self.last_summarized_activity
-        ).total_seconds() > SUMMARIZE_ACTIVITY_INTERVAL:
-            recent_activity = await self._summarize_activity()
-        else:
-            recent_activity = self.recent_activity
+        # Get a summary of the recent activity and the conversation so far
+        recent_activity, conversation_history = await asyncio.gather(
+            self._get_recent_activity(),
+            get_conversation_history(self.id, self.context),
+        )
 
         # Make the reaction prompter
         reaction_prompter = Prompter(
@@ -829,9 +942,7 @@ class Agent(BaseModel):
                     f"{index}. {event.description}"
                     for index, event in enumerate(events)
                 ],
-                "conversation_history": await get_conversation_history(
-                    self.id, self.context
-                ),
+                "conversation_history": conversation_history,
             },
         )
 
@@ -876,6 +987,7 @@ class Agent(BaseModel):
             if plan.related_message
             else plan.description,
             memories=self.memories,
+            now=self.context.clock.now(),
             k=20,
         )
 
@@ -910,7 +1022,7 @@ class Agent(BaseModel):
 
             event = Event(
                 agent_id=self.id,
-                timestamp=datetime.now(pytz.utc),
+                timestamp=self.context.clock.now(),
                 type=EventType.NON_MESSAGE,
                 description=f"{self.full_name} has failed to complete the following: {plan.description} at the location: {plan.location.name}. {self.full_name} had the following problem: {resp.output}.",
                 location_id=self.location.id,
@@ -944,7 +1056,7 @@ class Agent(BaseModel):
             self._log("Action Completed", f"{plan.description}")
 
             # update the plan in the local agent object
-            plan.completed_at = datetime.now(pytz.utc)
+            plan.completed_at = self.context.clock.now()
             plan.scratchpad = resp.scratchpad
             plan.status = resp.status
             self.update_plan(plan)
@@ -977,8 +1089,11 @@ class Agent(BaseModel):
 
         # Get new events witnessed by this agent
         last_checked_events = self.last_checked_events
+        # Only moved forward once the events are in memory, so a failure here sees them again
+        checked_events_at = self.context.clock.now()
 
-        self.last_checked_events = datetime.now(pytz.utc)
+        # Picks up edits to locations, e.g. who is allowed in them
+        await self.context.refresh_locations()
 
         (events, _) = await self.context.events_manager.get_events(
             after=last_checked_events, witness_ids=[self.id], force_refresh=True
@@ -990,25 +1105,42 @@ class Agent(BaseModel):
         )
 
         if len(events) > 0:
-            # Make new memories based on the events
-            new_memories = [
-                await self._add_memory(
-                    event.description,
-                    created_at=event.timestamp,
-                    type=MemoryType.OBSERVATION,
-                    log=False,
-                )
-                for event in events
-            ]
+            # Make new memories based on the events, all at once, but keep them in event order
+            new_memories = await asyncio.gather(
+                *[
+                    self._make_memory(
+                        event.description,
+                        created_at=event.timestamp,
+                        type=MemoryType.OBSERVATION,
+                    )
+                    for event in events
+                ]
+            )
+            for memory in new_memories:
+                await self._save_memory(memory, log=False)
+
+        self.last_checked_events = checked_events_at
 
         return events
 
-    async def write_progress_to_file(self):
-        agents_folder = os.path.join(os.getcwd(), "agents")
-        if not os.path.exists(agents_folder):
-            os.makedirs(agents_folder)
+    async def write_progress_to_file(self, force: bool = False):
+        """Rewrites the agent's progress file, at most every PROGRESS_FILE_INTERVAL seconds"""
+        if not PROGRESS_FILES:
+            return
 
-        file_path = os.path.join(agents_folder, f"{self.full_name}.txt")
+        now = time.monotonic()
+        if (
+            not force
+            and self._progress_written_at is not None
+            and now - self._progress_written_at < PROGRESS_FILE_INTERVAL
+        ):
+            return
+        self._progress_written_at = now
+
+        # One folder per world, so agents with the same name in other worlds don't collide
+        file_path = os.path.join(
+            os.getcwd(), "agents", str(self.world_id), f"{self.full_name}.txt"
+        )
 
         plans_in_progress = [
             "🏃‍♂️ " + plan.description
@@ -1030,35 +1162,90 @@ class Agent(BaseModel):
 
         current_plans = "\n".join(plans_to_do) if len(plans_to_do) > 0 else "No plans"
 
-        # Sort memories in reverse chronological order
-        sorted_memories = sorted(
-            self.memories, key=lambda m: m.created_at, reverse=True
+        # Memories are added in roughly chronological order, so the latest ones are at the end.
+        # Only those are listed, in reverse chronological order, so the cost doesn't grow with the agent's age
+        recent_memories = sorted(
+            self.memories[-PROGRESS_FILE_MEMORIES:],
+            key=lambda m: m.created_at,
+            reverse=True,
         )
 
-        memories = "\n".join(
-            [
-                f"{memory.created_at.replace(tzinfo=pytz.utc).strftime('%Y-%m-%d %H:%M:%S')}: {'👀' if memory.type == MemoryType.OBSERVATION else '💭'} {memory.description} (Importance: {memory.importance})"
-                for memory in sorted_memories
-            ]
-        )
+        memory_lines = {
+            memory.id: self._memory_lines.get(memory.id)
+            or f"{memory.created_at.replace(tzinfo=pytz.utc).strftime('%Y-%m-%d %H:%M:%S')}: {'👀' if memory.type == MemoryType.OBSERVATION else '💭'} {memory.description} (Importance: {memory.importance})"
+            for memory in recent_memories
+        }
+        self._memory_lines = memory_lines
 
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(
-                f"* {self.full_name}\n\nCurrent Action:\n{current_action}\n\nLocation: {self.location.name}\n\nCurrent Conversations:\n{conversation_history}\n\nCurrent Plans:\n{current_plans}\n\nMemories:\n{memories}\n"
-            )
+        memories = "\n".join(memory_lines.values())
+
+        progress = f"* {self.full_name}\n\nCurrent Action:\n{current_action}\n\nLocation: {self.location.name}\n\nCurrent Conversations:\n{conversation_history}\n\nCurrent Plans:\n{current_plans}\n\nMemories:\n{memories}\n"
+
+        await asyncio.to_thread(_write_file, file_path, progress)
+
+    def _is_idle(self, events: list[Event]) -> bool:
+        """Idle agents have seen nothing new and are only waiting on their current plan"""
+        if len(events) > 0 or len(self.plans) == 0:
+            return False
+
+        current_plan = self.plans[0]
+
+        if current_plan.status != PlanStatus.IN_PROGRESS or not current_plan.scratchpad:
+            return False
+
+        last_tool = current_plan.scratchpad[-1]["action"]["tool"]
+
+        return last_tool.strip() == ToolName.WAIT.value
+
+    def next_wakeup(self) -> Optional[datetime]:
+        """The deadline of the current plan, if it hasn't passed yet"""
+        if len(self.plans) == 0:
+            return None
 
-    async def run_for_one_step(self):
-        await asyncio.sleep(random.random() * 3)
+        deadline = self.plans[0].deadline
 
-        events = await self.observe()
+        return deadline if deadline > self.context.clock.now() else None
+
+    async def _run_phase(
+        self, phase: str, coroutine, deadlines: dict[str, float]
+    ):
+        """Awaits a phase of the step, cancelling it if it runs past its deadline"""
+        deadline = deadlines.get(phase)
+        if not deadline:
+            return await coroutine
+
+        try:
+            return await asyncio.wait_for(coroutine, deadline)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"{phase} took longer than {deadline}s")
+
+    async def run_for_one_step(
+        self,
+        skip_if_idle: bool = False,
+        phase_deadlines: Optional[dict[str, float]] = None,
+    ) -> bool:
+        """Runs one observe, react and act step. Returns False if the step was skipped because the agent is idle
+
+        Phases that run past their entry in phase_deadlines are cancelled and raise asyncio.TimeoutError.
+        """
+        if phase_deadlines is None:
+            phase_deadlines = {}
+
+        events = await self._run_phase("observe", self.observe(), phase_deadlines)
+
+        if skip_if_idle and self._is_idle(events):
+            self._log("Idle", "Nothing new has happened, waiting for events...")
+            return False
 
         # if there's no current plan, make some
         if len(self.plans) == 0:
             print(f"{self.full_name} has no plans, making some...")
-            await self._plan()
+            await self._run_phase("plan", self._plan(), phase_deadlines)
 
         # Decide how to react to these events
-        self.react_response = await self._react(events)
+        self.react_response = await self._run_phase(
+            "react", self._react(events), phase_deadlines
+        )
 
         # If the reaction calls to cancel the current plan, remove the first one
         if self.react_response.reaction == Reaction.CANCEL:
@@ -1067,14 +1254,21 @@ class Agent(BaseModel):
         # If the reaction calls to postpone the current plan, insert the new plan at the top
         elif self.react_response.reaction == Reaction.POSTPONE:
             # create a new plan from the LLMSinglePlan
-            new_plan = await SinglePlan.from_llm_single_plan(self.id, self.react_response.new_plan)
+            new_plan = await SinglePlan.from_llm_single_plan(
+                self.id,
+                self.react_response.new_plan,
+                locations=self.allowed_locations,
+                created_at=self.context.clock.now(),
+            )
             self.plans.insert(0, new_plan)
 
         # Work through the plans
-        await self._do_first_plan()
+        await self._run_phase("act", self._do_first_plan(), phase_deadlines)
 
         # Reflect, if we should
         if await self._should_reflect():
-            await self._reflect()
+            await self._run_phase("reflect", self._reflect(), phase_deadlines)
 
         await self.write_progress_to_file()
+
+        return True
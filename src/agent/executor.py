@@ -2,6 +2,7 @@ import json
 import os
 import re
 import time
+from collections import OrderedDict
 from enum import Enum
 from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
 from uuid import UUID
@@ -33,7 +34,11 @@ from ..tools.name import ToolName
 from ..utils.colors import LogColor
 from ..utils.formatting import print_to_console
 from ..utils.models import ChatModel
-from ..utils.parameters import DEFAULT_FAST_MODEL, DEFAULT_SMART_MODEL
+from ..utils.parameters import (
+    DEFAULT_FAST_MODEL,
+    DEFAULT_SMART_MODEL,
+    EXECUTOR_CACHE_SIZE,
+)
 from ..utils.prompt import PromptString
 from .message import AgentMessage, get_conversation_history
 from .plans import PlanStatus, SinglePlan
@@ -42,9 +47,32 @@ from .parser_utils import MessageParser
 load_dotenv()
 
 
+def render_tool_descriptions(tools: List[BaseTool]) -> str:
+    return "\n".join([f"{tool.name}: {tool.description}" for tool in tools])
+
+
+# Executor chains by agent id and rendered tools, least recently used first
+_executors: "OrderedDict[tuple[str, str], CustomSingleActionAgent]" = OrderedDict()
+
+
 class CustomPromptTemplate(BaseChatPromptTemplate):
     template: str
     tools: List[BaseTool]
+    # Rendered once from the tools, they don't change between calls
+    tool_descriptions: str = ""
+    tool_names: str = ""
+
+    @classmethod
+    def from_tools(
+        cls, template: str, tools: List[BaseTool], input_variables: List[str]
+    ) -> "CustomPromptTemplate":
+        return cls(
+            template=template,
+            tools=tools,
+            tool_descriptions=render_tool_descriptions(tools),
+            tool_names=", ".join([tool.name for tool in tools]),
+            input_variables=input_variables,
+        )
 
     @override
     def format_messages(self, **kwargs) -> List[HumanMessage]:
@@ -55,10 +83,8 @@ class CustomPromptTemplate(BaseChatPromptTemplate):
             thoughts += f"\nObservation: {observation}\nThought: "
         kwargs["agent_scratchpad"] = thoughts
 
-        kwargs["tools"] = "\n".join(
-            [f"{tool.name}: {tool.description}" for tool in self.tools]
-        )
-        kwargs["tool_names"] = ", ".join([tool.name for tool in self.tools])
+        kwargs["tools"] = self.tool_descriptions
+        kwargs["tool_names"] = self.tool_names
 
         formatted = self.template.format(**kwargs)
 
@@ -117,44 +143,47 @@ class CustomOutputParser(AgentOutputParser, BaseModel):
             return AgentAction(tool=action, tool_input=action_input, log=llm_output)
             
         except Exception as e:
-            # If all parsing fails, try to get formatting correction
-            llm = ChatModel(DEFAULT_FAST_MODEL)
-            formatting_correction = (
-                f"Could not parse the LLM output: `{llm_output}`\n\n"
-                f"Please reformat to match:\n"
-                f"Action: speak\n"
-                f"Action Input:\n"
-                f"recipient\n"
-                f"message"
+            # The agent asks for a formatting correction and hands it to parse_correction
+            raise OutputParserException(
+                f"Could not parse LLM output: `{llm_output}`", llm_output=llm_output
             )
 
-            retry = llm.get_chat_completion_sync(
-                [SystemMessage(content=formatting_correction)]
-            )
+    def formatting_correction(self, llm_output: str) -> str:
+        return (
+            f"Could not parse the LLM output: `{llm_output}`\n\n"
+            f"Please reformat to match:\n"
+            f"Action: speak\n"
+            f"Action Input:\n"
+            f"recipient\n"
+            f"message"
+        )
 
-            try:
-                # Ensure parser is initialized before retry
-                if self._parser is None:
-                    object.__setattr__(self, '_parser', MessageParser(tools=self.tools))
+    def parse_correction(
+        self, llm_output: str, retry: str
+    ) -> Union[AgentAction, AgentFinish]:
+        try:
+            # Ensure parser is initialized before retry
+            if self._parser is None:
+                object.__setattr__(self, '_parser', MessageParser(tools=self.tools))
 
-                action, action_input = self._parser.extract_action_input(retry)
-                action = self._parser.normalize_action(action)
-                if action == "speak":
-                    action_input = self._parser.extract_message(action_input)
-                return AgentAction(tool=action, tool_input=action_input, log=llm_output)
+            action, action_input = self._parser.extract_action_input(retry)
+            action = self._parser.normalize_action(action)
+            if action == "speak":
+                action_input = self._parser.extract_message(action_input)
+            return AgentAction(tool=action, tool_input=action_input, log=llm_output)
+        except:
+            # Final fallback: try to extract any message-like content
+            try:
+                message = self._parser.extract_message(llm_output)
+                return AgentAction(
+                    tool="speak",
+                    tool_input=message,
+                    log=llm_output
+                )
             except:
-                # Final fallback: try to extract any message-like content
-                try:
-                    message = self._parser.extract_message(llm_output)
-                    return AgentAction(
-                        tool="speak",
-                        tool_input=message,
-                        log=llm_output
-                    )
-                except:
-                    raise OutputParserException(
-                        f"Could not parse LLM output after retrying: \n`{retry}`. \nFirst attempt: \n`{llm_output}`"
-                    )
+                raise OutputParserException(
+                    f"Could not parse LLM output after retrying: \n`{retry}`. \nFirst attempt: \n`{llm_output}`"
+                )
 
     @override
     def get_format_instructions(self) -> str:
@@ -192,15 +221,50 @@ class PlanExecutorResponse(BaseModel):
 
 
 class CustomSingleActionAgent(LLMSingleActionAgent):
+    def _plan_and_correct(self, *args, **kwargs) -> Union[AgentAction, AgentFinish]:
+        try:
+            return super().plan(*args, **kwargs)
+        except OutputParserException as e:
+            if e.llm_output is None:
+                raise
+            retry = ChatModel(DEFAULT_FAST_MODEL).get_chat_completion_sync(
+                [SystemMessage(content=self.output_parser.formatting_correction(e.llm_output))]
+            )
+            return self.output_parser.parse_correction(e.llm_output, retry)
+
+    async def _aplan_and_correct(
+        self, *args, **kwargs
+    ) -> Union[AgentAction, AgentFinish]:
+        try:
+            return await super().aplan(*args, **kwargs)
+        except OutputParserException as e:
+            if e.llm_output is None:
+                raise
+            retry = await ChatModel(DEFAULT_FAST_MODEL).get_chat_completion(
+                [SystemMessage(content=self.output_parser.formatting_correction(e.llm_output))]
+            )
+            return self.output_parser.parse_correction(e.llm_output, retry)
+
     @override
     def plan(self, *args, **kwargs) -> Union[AgentAction, AgentFinish]:
         try:
-            result = super().plan(*args, **kwargs)
+            result = self._plan_and_correct(*args, **kwargs)
         except OutputParserException as e:
             print("OutputParserException", e)
             if "input" in kwargs:
                 kwargs["input"] = kwargs["input"] + PromptString.OUTPUT_FORMAT.value
-            result = super().plan(*args, **kwargs)
+            result = self._plan_and_correct(*args, **kwargs)
+        return result
+
+    @override
+    async def aplan(self, *args, **kwargs) -> Union[AgentAction, AgentFinish]:
+        try:
+            result = await self._aplan_and_correct(*args, **kwargs)
+        except OutputParserException as e:
+            print("OutputParserException", e)
+            if "input" in kwargs:
+                kwargs["input"] = kwargs["input"] + PromptString.OUTPUT_FORMAT.value
+            result = await self._aplan_and_correct(*args, **kwargs)
         return result
 
 
@@ -226,7 +290,14 @@ class PlanExecutor(BaseModel):
         )
 
     def get_executor(self, tools: list[CustomTool]) -> CustomSingleActionAgent:
-        prompt = CustomPromptTemplate(
+        # The chain only depends on the tools, the rest of the prompt is formatted per call.
+        # Speak's description names who is nearby, so it's keyed on descriptions, not just names
+        key = (str(self.agent_id), render_tool_descriptions(tools))
+        if key in _executors:
+            _executors.move_to_end(key)
+            return _executors[key]
+
+        prompt = CustomPromptTemplate.from_tools(
             template=PromptString.EXECUTE_PLAN.value,
             tools=tools,
             input_variables=[
@@ -248,6 +319,11 @@ class PlanExecutor(BaseModel):
             output_parser=output_parser,
             stop=["\nObservation:"],
         )
+
+        _executors[key] = executor
+        if len(_executors) > EXECUTOR_CACHE_SIZE:
+            _executors.popitem(last=False)
+
         return executor
 
     def intermediate_steps_to_list(
@@ -297,7 +373,7 @@ class PlanExecutor(BaseModel):
             intermediate_steps = []
 
         conversation_history = await get_conversation_history(
-            self.context.get_agent_location_id(self.agent_id), self.context
+            self.agent_id, self.context
         )
 
         if self.relevant_memories:
@@ -308,7 +384,8 @@ class PlanExecutor(BaseModel):
         else:
             relevant_memories = ""
 
-        response = executor.plan(
+        # Awaited rather than called, so a step deadline can cancel a hung request
+        response = await executor.aplan(
             input=self.plan.make_plan_prompt(),
             intermediate_steps=intermediate_steps,
             your_name=self.context.get_agent_full_name(self.agent_id),
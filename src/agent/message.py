@@ -1,4 +1,7 @@
+import asyncio
+import bisect
 import re
+from collections import OrderedDict
 from datetime import datetime
 from enum import Enum
 from typing import Optional, Union, Dict
@@ -6,11 +9,28 @@ from uuid import UUID
 
 from pydantic import BaseModel, Field
 
+from src.utils.database.client import get_database
+
 from ..event.base import Event, EventType, MessageEventSubtype
 from ..location.base import Location
 from ..utils.general import deduplicate_list
 from ..world.context import WorldContext
 
+# Parsed messages are cached by event id, so each message event is only parsed once
+PARSED_MESSAGE_CACHE_SIZE = 2000
+
+CONVERSATION_HISTORY_LENGTH = 20
+
+AGENT_TO_AGENT_PATTERN = re.compile(
+    r"(?P<sender>[\w\s]+) said to (?P<recipient>[\w\s;]+)(?: in the [\w\s]+)?: ['\"]*(?P<message>.*)['\"]*$"
+)
+AGENT_TO_AGENT_FALLBACK_PATTERN = re.compile(
+    r"(?P<sender>[\w\s]+) said to (?P<recipient>[\w\s;]+)(?: in the [\w\s]+)?: (?P<message>.*)"
+)
+AGENT_TO_HUMAN_PATTERN = re.compile(
+    r"(?P<sender>[\w\s]+) asked the humans: ['\"]*(?P<message>.*)['\"]*$"
+)
+
 
 class AgentMessage(BaseModel):
     content: str
@@ -49,11 +69,7 @@ class AgentMessage(BaseModel):
         agent_location_id = context.get_agent_location_id(agent_id)
 
         # make the location object
-        location = [
-            Location(**loc)
-            for loc in context.locations
-            if str(loc["id"]) == str(agent_location_id)
-        ][0]
+        location = Location(**context.get_location_from_location_id(agent_location_id))
 
         if type == MessageEventSubtype.AGENT_TO_AGENT:
             # Handle both string and dict inputs
@@ -94,7 +110,7 @@ class AgentMessage(BaseModel):
                 location=location,
                 context=context,
                 type=type,
-                timestamp=datetime.now(),
+                timestamp=context.clock.now(),
                 sender_name=agent_name,
             )
 
@@ -104,21 +120,33 @@ class AgentMessage(BaseModel):
             location=location,
             context=context,
             type=type,
-            timestamp=datetime.now(),
+            timestamp=context.clock.now(),
             sender_name=agent_name,
         )
 
     @classmethod
     def from_event(cls, event: Event, context: WorldContext):
+        """Parses a message event, reusing the cached result if the event was seen before"""
         if event.type != EventType.MESSAGE:
             raise ValueError("Event must be of type message")
 
+        message = _parsed_messages.get(event.id)
+        if message is not None:
+            _parsed_messages.move_to_end(event.id)
+            return message
+
+        message = cls._parse_event(event, context)
+
+        _parsed_messages[event.id] = message
+        if len(_parsed_messages) > PARSED_MESSAGE_CACHE_SIZE:
+            _parsed_messages.popitem(last=False)
+
+        return message
+
+    @classmethod
+    def _parse_event(cls, event: Event, context: WorldContext):
         # get the location object
-        location = [
-            Location(**loc)
-            for loc in context.locations
-            if str(loc["id"]) == str(event.location_id)
-        ][0]
+        location = Location(**context.get_location_from_location_id(event.location_id))
 
         discord_id = (
             event.metadata["discord_id"]
@@ -126,14 +154,35 @@ class AgentMessage(BaseModel):
             else None
         )
 
+        # Events with structured message columns can be read directly
+        if event.content is not None:
+            recipient_id = event.recipient_ids[0] if event.recipient_ids else None
+
+            return cls(
+                content=event.content,
+                sender_id=event.sender_id,
+                sender_name=context.get_agent_full_name(event.sender_id)
+                if event.sender_id is not None
+                else "Human",
+                location=location,
+                recipient_id=recipient_id,
+                recipient_name=context.get_agent_full_name(recipient_id)
+                if recipient_id is not None
+                else None,
+                context=context,
+                timestamp=event.timestamp,
+                event_id=event.id,
+                type=event.subtype,
+                discord_id=discord_id,
+            )
+
+        # Older events only store the description, so parse the message out of it
         if event.subtype == MessageEventSubtype.AGENT_TO_AGENT:
             # Handle both quoted and unquoted message formats, including multiple recipients
-            pattern = r"(?P<sender>[\w\s]+) said to (?P<recipient>[\w\s;]+)(?: in the [\w\s]+)?: ['\"]*(?P<message>.*)['\"]*$"
-            match = re.search(pattern, event.description)
+            match = AGENT_TO_AGENT_PATTERN.search(event.description)
             if not match:
                 # If no match, try simpler pattern without quotes
-                pattern = r"(?P<sender>[\w\s]+) said to (?P<recipient>[\w\s;]+)(?: in the [\w\s]+)?: (?P<message>.*)"
-                match = re.search(pattern, event.description)
+                match = AGENT_TO_AGENT_FALLBACK_PATTERN.search(event.description)
                 if not match:
                     raise ValueError(f"Could not parse message: {event.description}")
             
@@ -198,8 +247,7 @@ class AgentMessage(BaseModel):
             )
 
         elif event.subtype == MessageEventSubtype.AGENT_TO_HUMAN:
-            pattern = r"(?P<sender>[\w\s]+) asked the humans: ['\"]*(?P<message>.*)['\"]*$"
-            match = re.search(pattern, event.description)
+            match = AGENT_TO_HUMAN_PATTERN.search(event.description)
             if not match:
                 raise ValueError(f"Could not parse message: {event.description}")
 
@@ -238,6 +286,7 @@ class AgentMessage(BaseModel):
 
         event = Event(
             agent_id=self.sender_id,
+            timestamp=self.context.clock.now(),
             type=EventType.MESSAGE,
             subtype=self.type,
             description=event_message,
@@ -245,6 +294,9 @@ class AgentMessage(BaseModel):
             metadata={"discord_id": self.discord_id}
             if self.discord_id is not None
             else None,
+            sender_id=self.sender_id,
+            recipient_ids=[self.recipient_id] if self.recipient_id is not None else [],
+            content=self.content,
         )
 
         self.event_id = event.id
@@ -258,6 +310,9 @@ class AgentMessage(BaseModel):
             return f"[{self.location.name}] {self.sender_name} to {self.recipient_name}: {self.content}"
 
 
+_parsed_messages: "OrderedDict[UUID, AgentMessage]" = OrderedDict()
+
+
 class LLMMessageResponse(BaseModel):
     to: str = Field(description="The recipient of the message")
     content: str = Field(description="The content of the message")
@@ -269,30 +324,126 @@ def get_latest_messages(messages: list[AgentMessage]) -> list[AgentMessage]:
     return deduplicate_list(messages, key=lambda x: str(x.sender_id))
 
 
-async def get_conversation_history(
+class ConversationHistory:
+    """The latest messages witnessed by an agent, kept formatted and in order"""
+
+    def __init__(self, max_length: int = CONVERSATION_HISTORY_LENGTH):
+        self.max_length = max_length
+        self.messages: list[tuple[datetime, UUID, str]] = []
+        self.text = ""
+
+    def add(self, message: AgentMessage) -> None:
+        if any(event_id == message.event_id for _, event_id, _ in self.messages):
+            return
+
+        # Messages usually arrive in order, but events from other processes can be late
+        bisect.insort(
+            self.messages,
+            (
+                message.timestamp,
+                message.event_id,
+                f"{message.sender_name}: {message.content} @ {message.timestamp}",
+            ),
+            key=lambda m: m[0],
+        )
+
+        if len(self.messages) > self.max_length:
+            del self.messages[0]
+
+        self.text = "\n".join([line for _, _, line in self.messages])
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def record_message(event: Event, context: WorldContext) -> None:
+    """Adds a new message event to the history of every agent that witnessed it"""
+    if event.type != EventType.MESSAGE:
+        return
+
+    histories = [
+        context.conversation_histories[str(witness_id)]
+        for witness_id in event.witness_ids
+        if str(witness_id) in context.conversation_histories
+    ]
+
+    if len(histories) == 0:
+        return
+
+    try:
+        message = AgentMessage.from_event(event, context)
+    except Exception as e:
+        print(f"Could not add message to conversation history: {e}")
+        return
+
+    for history in histories:
+        history.add(message)
+
+
+def track_conversation_histories(context: WorldContext) -> None:
+    """Feeds new message events to the conversation histories in the context"""
+    context.events_manager.add_listener(lambda event: record_message(event, context))
+
+
+async def load_conversation_history(
     agent_id: UUID | str,
     context: WorldContext,
-) -> str:
-    """Gets up to 20 messages from the location. If a message is provided, only gets messages from that agent."""
-    if isinstance(agent_id, str):
-        agent_id = UUID(agent_id)
-
-    # get all the messages sent at the location witnessed by the agent_id
-    (message_events, _) = await context.events_manager.get_events(
-        type=EventType.MESSAGE,
-        witness_ids=[agent_id],
+) -> ConversationHistory:
+    """Restores an agent's conversation history from the DB and keeps it up to date"""
+    if len(context.conversation_histories) == 0:
+        # The first history loaded starts tracking all of them
+        track_conversation_histories(context)
+
+    rows = await (await get_database()).get_witnessed_messages(
+        str(agent_id), CONVERSATION_HISTORY_LENGTH
     )
 
-    messages = [AgentMessage.from_event(event, context) for event in message_events]
+    return _restore_conversation_history(agent_id, rows, context)
 
-    # sort the messages by timestamp, with the newest messages last
-    messages.sort(key=lambda x: x.timestamp)
 
-    # limit the messages to 20
-    messages = messages[-20:]
+async def load_conversation_histories(
+    agent_ids: list[UUID | str],
+    context: WorldContext,
+) -> None:
+    """Restores the conversation histories of many agents at once"""
+    if len(context.conversation_histories) == 0:
+        track_conversation_histories(context)
+
+    database = await get_database()
+    rows_by_agent = await asyncio.gather(
+        *[
+            database.get_witnessed_messages(str(agent_id), CONVERSATION_HISTORY_LENGTH)
+            for agent_id in agent_ids
+        ]
+    )
 
-    formatted_messages = [
-        f"{m.sender_name}: {m.content} @ {m.timestamp}" for m in messages
-    ]
+    for agent_id, rows in zip(agent_ids, rows_by_agent):
+        _restore_conversation_history(agent_id, rows, context)
+
+
+def _restore_conversation_history(
+    agent_id: UUID | str, rows: list[dict], context: WorldContext
+) -> ConversationHistory:
+    history = ConversationHistory()
+    for row in rows:
+        try:
+            history.add(AgentMessage.from_event(Event.from_db_dict(row), context))
+        except Exception as e:
+            print(f"Could not add message to conversation history: {e}")
+
+    context.conversation_histories[str(agent_id)] = history
+
+    return history
+
+
+async def get_conversation_history(
+    agent_id: UUID | str,
+    context: WorldContext,
+) -> str:
+    """Gets up to 20 of the latest messages witnessed by the agent."""
+    history = context.conversation_histories.get(str(agent_id))
+
+    if history is None:
+        history = await load_conversation_history(agent_id, context)
 
-    return "\n".join(formatted_messages)
+    return str(history)
@@ -1,15 +1,17 @@
-from datetime import datetime
+import copy
+from datetime import datetime, timedelta
 from enum import Enum
 from typing import Generic, List, Literal, Optional, TypeVar
 from uuid import UUID, uuid4
 
 import pytz
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, PrivateAttr, validator
 from src.utils.database.base import Tables
 
 from src.utils.database.client import get_database
 
 from ..location.base import Location
+from ..utils.parameters import TIME_SPEED_MULTIPLIER
 from .message import AgentMessage
 
 
@@ -50,6 +52,8 @@ class SinglePlan(BaseModel):
     status: PlanStatus
     scratchpad: list[dict] = []
     completed_at: Optional[datetime] = None
+    # The row as last written to the DB, empty if it hasn't been written yet
+    _persisted_row: dict = PrivateAttr(default_factory=dict)
 
     def __init__(
         self,
@@ -68,6 +72,7 @@ class SinglePlan(BaseModel):
         if id is None:
             id = uuid4()
 
+        # Plans made inside a world pass the time from its clock
         if created_at is None:
             created_at = datetime.now(tz=pytz.utc)
 
@@ -91,6 +96,18 @@ class SinglePlan(BaseModel):
     def __str__(self):
         return f"[PLAN] - {self.description} at {self.location.name if self.location else 'unknown location'}"
 
+    @property
+    def deadline(self) -> datetime:
+        """When the plan runs out of time, scaled by TIME_SPEED_MULTIPLIER like memory recency"""
+        created_at = (
+            self.created_at
+            if self.created_at.tzinfo is not None
+            else pytz.utc.localize(self.created_at)
+        )
+        return created_at + timedelta(
+            hours=self.max_duration_hrs / TIME_SPEED_MULTIPLIER
+        )
+
     @classmethod
     async def from_id(cls, id: UUID):
         data = await (await get_database()).get_by_id(Tables.Plan, id)
@@ -108,24 +125,47 @@ class SinglePlan(BaseModel):
         return cls(**plan_data)
 
     @classmethod
-    async def from_llm_single_plan(cls, agent_id: UUID, llm_plan: LLMSinglePlan):
-        try:
-            location = await Location.from_name(llm_plan.location_name)
-        except Exception as e:
-            print(f"Warning: Could not find location {llm_plan.location_name}: {str(e)}")
-            location = None
+    async def from_llm_single_plan(
+        cls,
+        agent_id: UUID,
+        llm_plan: LLMSinglePlan,
+        locations: Optional[dict[str, Location]] = None,
+        created_at: Optional[datetime] = None,
+    ):
+        """Makes a plan from the LLM's, resolving its location name in locations if given"""
+        location = (locations or {}).get(llm_plan.location_name)
+
+        if location is None:
+            try:
+                location = await Location.from_name(llm_plan.location_name)
+            except Exception as e:
+                print(f"Warning: Could not find location {llm_plan.location_name}: {str(e)}")
+                location = None
 
         return cls(
             description=llm_plan.description,
             max_duration_hrs=llm_plan.max_duration_hrs,
             stop_condition=llm_plan.stop_condition,
             agent_id=agent_id,
-            location=location
+            location=location,
+            created_at=created_at,
         )
 
     async def delete(self):
         return await (await get_database()).get_by_id(Tables.Plan, str(self.id))
 
+    def dirty_fields(self) -> dict:
+        """The fields of the row that changed since it was last written"""
+        return {
+            key: value
+            for key, value in self._db_dict().items()
+            if key not in self._persisted_row or self._persisted_row[key] != value
+        }
+
+    def mark_persisted(self, fields: Optional[dict] = None) -> None:
+        # Copied, so changes to the scratchpad in place still show up as dirty
+        self._persisted_row.update(copy.deepcopy(fields or self._db_dict()))
+
     def _db_dict(self):
         row = {
             "id": str(self.id),
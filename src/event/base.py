@@ -3,7 +3,7 @@ import json
 import threading
 from datetime import datetime
 from enum import Enum
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 from uuid import UUID, uuid4
 
 import pytz
@@ -13,6 +13,7 @@ from sqlalchemy import desc
 from src.utils.database.base import Tables
 from src.utils.database.client import get_database
 
+from ..utils.clock import SimulationClock
 from ..utils.colors import LogColor
 from ..utils.formatting import print_to_console
 from ..utils.parameters import DEFAULT_WORLD_ID
@@ -53,6 +54,9 @@ class Event(BaseModel):
     description: str
     location_id: UUID
     metadata: Optional[Any]
+    sender_id: Optional[UUID] = None
+    recipient_ids: list[UUID] = []
+    content: Optional[str] = None
 
     def __init__(
         self,
@@ -65,11 +69,15 @@ class Event(BaseModel):
         subtype: Optional[Subtype] = None,
         metadata: Optional[Any] = None,
         witness_ids: list[UUID] = [],
+        sender_id: Optional[UUID | str] = None,
+        recipient_ids: Optional[list[UUID | str]] = None,
+        content: Optional[str] = None,
         **kwargs: Any,
     ):
         if id is None:
             id = uuid4()
 
+        # Events created inside a world pass the time from its clock
         if timestamp is None:
             timestamp = datetime.now(pytz.utc)
 
@@ -83,6 +91,12 @@ class Event(BaseModel):
             if isinstance(witness_id, str):
                 witness_id = UUID(witness_id)
 
+        if isinstance(sender_id, str):
+            sender_id = UUID(sender_id)
+
+        if recipient_ids is None:
+            recipient_ids = []
+
         subtype = Subtype(subtype) if subtype is not None else None
         if (
             type == EventType.MESSAGE
@@ -101,6 +115,9 @@ class Event(BaseModel):
             location_id=location_id,
             metadata=metadata,
             witness_ids=witness_ids,
+            sender_id=sender_id,
+            recipient_ids=recipient_ids,
+            content=content,
         )
 
     def db_dict(self):
@@ -114,29 +131,41 @@ class Event(BaseModel):
             "location_id": str(self.location_id),
             "witness_ids": [str(witness_id) for witness_id in self.witness_ids],
             "metadata": self.metadata,
+            "sender_id": str(self.sender_id) if self.sender_id is not None else None,
+            "recipient_ids": [str(recipient_id) for recipient_id in self.recipient_ids],
+            "content": self.content,
         }
 
     @classmethod
-    async def from_id(cls, event_id: UUID) -> "Event":
-        data = await (await get_database()).get_by_id(Tables.Events, str(event_id))
-
-        if len(data) == 0:
-            raise ValueError(f"Event with id {event_id} not found")
-
-        event = data[0]
-
+    def from_db_dict(cls, event: dict) -> "Event":
+        """Create an event from a row of the Events table."""
         return cls(
             id=event["id"],
-            type=event["type"],
+            type=EventType(event["type"]),
             subtype=event["subtype"],
             description=event["description"],
-            location_id=event["location_id"],
+            location_id=event["location_id"]
+            if isinstance(event["location_id"], str)
+            else event["location_id"]["id"],
             agent_id=event["agent_id"],
             timestamp=datetime.fromisoformat(event["timestamp"]),
             witness_ids=event["witness_ids"],
             metadata=event["metadata"],
+            # Rows written before the structured message columns existed won't have these
+            sender_id=event.get("sender_id"),
+            recipient_ids=event.get("recipient_ids"),
+            content=event.get("content"),
         )
 
+    @classmethod
+    async def from_id(cls, event_id: UUID) -> "Event":
+        data = await (await get_database()).get_by_id(Tables.Events, str(event_id))
+
+        if len(data) == 0:
+            raise ValueError(f"Event with id {event_id} not found")
+
+        return cls.from_db_dict(data[0])
+
 
 RECENT_EVENTS_BUFFER = 500
 
@@ -148,64 +177,53 @@ class EventsManager(BaseModel):
     world_id: str
     last_refresh: datetime
     refresh_lock: Any
+    listeners: list[Any] = []
+    publishers: list[Any] = []
+    clock: SimulationClock
+
+    class Config:
+        arbitrary_types_allowed = True
 
-    def __init__(self, world_id: str, recent_events: list[Event]):
-        last_refresh = datetime.now(pytz.utc)
+    def __init__(
+        self, world_id: str, recent_events: list[Event], clock: SimulationClock
+    ):
+        last_refresh = clock.now()
 
         super().__init__(
             recent_events=recent_events,
             world_id=world_id,
             last_refresh=last_refresh,
             refresh_lock=asyncio.Lock(),
+            clock=clock,
         )
 
     @classmethod
-    async def from_world_id(cls, world_id: str):
+    async def from_world_id(cls, world_id: str, clock: SimulationClock):
         data = await (await get_database()).get_recent_events(
             world_id, RECENT_EVENTS_BUFFER
         )
-        recent_events = [
-            Event(
-                type=EventType(event["type"]),
-                subtype=event["subtype"],
-                description=event["description"],
-                location_id=event["location_id"] if isinstance(event["location_id"], str) else event["location_id"]["id"],
-                timestamp=datetime.fromisoformat(event["timestamp"]),
-                witness_ids=event["witness_ids"],
-                metadata=event["metadata"],
-                agent_id=event["agent_id"],
-            )
-            for event in data
-        ]
+        recent_events = [Event.from_db_dict(event) for event in data]
         return cls(
             world_id=world_id,
             recent_events=recent_events,
+            clock=clock,
         )
 
     async def refresh_events(self) -> None:
         """Gathers the last RECENT_EVENTS_BUFFER events from the database and updates the self.recent_events list"""
 
-        started_checking_events = datetime.now(pytz.utc)
+        started_checking_events = self.clock.now()
 
         async with self.refresh_lock:
             # print("Refreshing events...")
             data = await (await get_database()).get_recent_events(
                 self.world_id, RECENT_EVENTS_BUFFER
             )
-            events = [
-                Event(
-                    id=event["id"],
-                    type=EventType(event["type"]),
-                    subtype=event["subtype"],
-                    description=event["description"],
-                    location_id=event["location_id"] if isinstance(event["location_id"], str) else event["location_id"]["id"],
-                    agent_id=event["agent_id"],
-                    timestamp=datetime.fromisoformat(event["timestamp"]),
-                    witness_ids=event["witness_ids"],
-                    metadata=event["metadata"],
-                )
-                for event in data
-            ]
+            events = [Event.from_db_dict(event) for event in data]
+
+            # Events written by other processes that we haven't seen yet
+            known_event_ids = set(event.id for event in self.recent_events)
+            new_events = [event for event in events if event.id not in known_event_ids]
 
             self.recent_events = events
             self.last_refresh = (
@@ -217,6 +235,32 @@ class EventsManager(BaseModel):
                 else started_checking_events
             )
 
+        # The events are newest first, listeners get them in the order they happened
+        self._notify_listeners(list(reversed(new_events)))
+
+    def add_listener(self, listener: Callable[[Event], None]) -> None:
+        """Registers a callback that gets called once for every new event"""
+        self.listeners.append(listener)
+
+    def add_publisher(self, publisher: Callable[[Event], None]) -> None:
+        """Registers a callback that gets called for every event created in this process"""
+        self.publishers.append(publisher)
+
+    def add_event(self, event: Event, publish: bool = True) -> None:
+        """Adds an event to the local events list.
+        Events delivered from other processes are added with publish=False"""
+        if publish:
+            for publisher in self.publishers:
+                publisher(event)
+
+        self.recent_events.append(event)
+        self._notify_listeners([event])
+
+    def _notify_listeners(self, events: list[Event]) -> None:
+        for event in events:
+            for listener in self.listeners:
+                listener(event)
+
     async def get_events(
         self,
         agent_id: Optional[UUID] = None,
@@ -228,7 +272,7 @@ class EventsManager(BaseModel):
         force_refresh: Optional[bool] = False,
     ) -> tuple[list[Event], datetime]:
         if (
-            (datetime.now(pytz.utc) - self.last_refresh).seconds
+            (self.clock.now() - self.last_refresh).seconds
             > REFRESH_INTERVAL_SECONDS
         ) or force_refresh:
             await self.refresh_events()
@@ -11,11 +11,14 @@ from dotenv import load_dotenv
 
 from src.utils.database.client import get_database
 from src.world.base import World
+from src.world.runtime import MultiWorldRuntime
+from src.world.shard import ShardedWorldRuntime
 
 from .utils.colors import LogColor
 from .utils.database.base import Tables
 from .utils.formatting import print_to_console
 from .utils.logging import init_logging
+from .utils.parameters import OFFLINE_MODE, WORLD_SHARDS, WORLDS_TO_RUN
 from .web import get_server
 from .utils.general import get_open_port
 
@@ -31,11 +34,14 @@ with open("pyproject.toml", "r") as f:
 openai_base_url = pyproject.get("tool", {}).get("openai", {}).get("base_url", "https://api.openai.com/v1")
 
 async def run_world_async():
-    api_key = os.getenv("OPENAI_API_KEY")
-    # api_key = os.getenv("OPENROUTER_API_KEY")
-    client = OpenAI(api_key=api_key, base_url=openai_base_url)
-    print(f"Using OpenAI base URL: {client.base_url}")
-    print(f"API Key: {api_key[:5]}...{api_key[-5:]}")
+    if OFFLINE_MODE:
+        print("Running offline with stand-in models, no API calls will be made")
+    else:
+        api_key = os.getenv("OPENAI_API_KEY")
+        # api_key = os.getenv("OPENROUTER_API_KEY")
+        client = OpenAI(api_key=api_key, base_url=openai_base_url)
+        print(f"Using OpenAI base URL: {client.base_url}")
+        print(f"API Key: {api_key[:5]}...{api_key[-5:]}")
     try:
         database = await get_database()
 
@@ -44,7 +50,31 @@ async def run_world_async():
         if len(worlds) == 0:
             raise ValueError("No worlds found!")
 
-        world = await World.from_id(worlds[-1]["id"])
+        if WORLD_SHARDS > 1:
+            print_to_console(
+                f"Welcome to {worlds[-1]['name']}!",
+                LogColor.ANNOUNCEMENT,
+                f"Running across {WORLD_SHARDS} shards\n",
+            )
+
+            await ShardedWorldRuntime(worlds[-1]["id"], WORLD_SHARDS).run()
+            return
+
+        if WORLDS_TO_RUN > 1:
+            runtime = await MultiWorldRuntime.from_ids(
+                [world["id"] for world in worlds[-WORLDS_TO_RUN:]]
+            )
+
+            print_to_console(
+                f"Welcome to {', '.join(world.name for world in runtime.worlds)}!",
+                LogColor.ANNOUNCEMENT,
+                f"Running {len(runtime.worlds)} worlds\n",
+            )
+
+            await runtime.run()
+            return
+
+        world = await World.load(worlds[-1]["id"])
 
         print_to_console(
             f"Welcome to {world.name}!",
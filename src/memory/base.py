@@ -34,14 +34,13 @@ class SingleMemory(BaseModel):
     last_accessed: datetime
     related_memory_ids: list[UUID]
 
-    @property
-    def recency(self) -> float:
+    def recency(self, now: datetime) -> float:
         if self.last_accessed.tzinfo is None:
             self.last_accessed = pytz.utc.localize(self.last_accessed)
 
-        last_retrieved_hours_ago = (
-            datetime.now(pytz.utc) - self.last_accessed
-        ) / timedelta(hours=1 / TIME_SPEED_MULTIPLIER)
+        last_retrieved_hours_ago = (now - self.last_accessed) / timedelta(
+            hours=1 / TIME_SPEED_MULTIPLIER
+        )
 
         decay_factor = 0.99
         return math.pow(decay_factor, last_retrieved_hours_ago)
@@ -62,12 +61,16 @@ class SingleMemory(BaseModel):
         embedding: np.ndarray,
         related_memory_ids: Optional[list[UUID]] = [],
         id: Optional[UUID] = None,
-        created_at: Optional[datetime] = datetime.now(tz=pytz.utc),
+        created_at: Optional[datetime] = None,
         last_accessed: Optional[datetime] = None,
     ):
         if id is None:
             id = uuid4()
 
+        # Memories created inside a world pass the time from its clock
+        if created_at is None:
+            created_at = datetime.now(pytz.utc)
+
         if isinstance(embedding, str):
             embedding = parse_array(embedding)
         else:
@@ -109,18 +112,18 @@ class SingleMemory(BaseModel):
     def __str__(self):
         return f"[{self.type.name}] - {self.description} ({round(self.importance, 1)})"
 
-    def update_last_accessed(self):
-        self.last_accessed = datetime.now(tz=pytz.utc)
+    def update_last_accessed(self, now: datetime):
+        self.last_accessed = now
 
     async def similarity(self, query: str) -> float:
         query_embedding = await get_embedding(query)
         return cosine_similarity(self.embedding, query_embedding)
 
-    async def relevance(self, query: str) -> float:
+    async def relevance(self, query: str, now: datetime) -> float:
         return (
             IMPORTANCE_WEIGHT * self.importance
             + SIMILARITY_WEIGHT * (await self.similarity(query))
-            + RECENCY_WEIGHT * self.recency
+            + RECENCY_WEIGHT * self.recency(now)
         )
 
 
@@ -133,12 +136,13 @@ class RelatedMemory(BaseModel):
 
 
 async def get_relevant_memories(
-    query: str, memories: list[SingleMemory], k: int = 5
+    query: str, memories: list[SingleMemory], now: datetime, k: int = 5
 ) -> list[SingleMemory]:
-    """Returns a list of the top k most relevant NON MESSAGE memories, based on the query string"""
+    """Returns a list of the top k most relevant NON MESSAGE memories, based on the query string.
+    Recency is measured up to now, the world's current time"""
 
     memories_with_relevance = [
-        RelatedMemory(memory=memory, relevance=await memory.relevance(query))
+        RelatedMemory(memory=memory, relevance=await memory.relevance(query, now))
         for memory in memories
     ]
 
@@ -3,6 +3,7 @@ import enum
 import inspect
 import os
 from enum import Enum
+from functools import lru_cache
 from typing import Any, Awaitable, Callable, List, Optional, Type, Union
 from uuid import UUID
 
@@ -187,27 +188,19 @@ ALLOWED_TOOLS = {
 }
 
 
-def get_tools(
-    tools: list[ToolName],
-    context: WorldContext,
-    agent_id: str | UUID,
-    include_worldwide=False,
-) -> List[CustomTool]:
-    location_id = context.get_agent_location_id(agent_id=agent_id)
-    location_name = context.get_location_name(location_id=location_id)
-    agents_at_location = context.get_agents_at_location(location_id=location_id)
-    other_agents = [a for a in agents_at_location if str(a["id"]) != str(agent_id)]
-    other_agent_names = ", ".join([a["full_name"] for a in other_agents]) or "nobody"
-
+def _build_tools() -> dict[ToolName, Optional[CustomTool]]:
+    """Builds every tool except speak, whose description depends on the agent's location"""
     SEARCH_ENABLED = bool(os.getenv("SERPAPI_KEY"))
     WOLFRAM_ENABLED = bool(os.getenv("WOLFRAM_ALPHA_APPID"))
 
-    TOOLS: dict[ToolName, CustomTool] = {
+    search = SerpAPIWrapper() if SEARCH_ENABLED else None
+
+    return {
         ToolName.SEARCH: CustomTool(
             name=ToolName.SEARCH.value,
-            func=SerpAPIWrapper().run,
+            func=search.run,
             description="search the web for information. input should be the search query.",
-            coroutine=SerpAPIWrapper().arun,
+            coroutine=search.arun,
             tool_usage_summarization_prompt="You have just searched Google with the following search input: {tool_input} and got the following result {tool_result}. Write a single sentence with useful information about how the result can help you accomplish your plan: {plan_description}.",
             tool_usage_description="To make progress on their plans, {agent_full_name} searched Google and realised the following: {tool_usage_reflection}.",
             requires_authorization=False,
@@ -216,17 +209,8 @@ def get_tools(
         )
         if SEARCH_ENABLED
         else None,
-        ToolName.SPEAK: CustomTool(
-            name=ToolName.SPEAK.value,
-            func=send_message_sync,
-            coroutine=send_message_async,
-            description=f'Challenge assumptions in the {location_name}. Target audience: [{other_agent_names}]. Input must be a semicolon-separated format: "recipient; message". Example: "everyone; Your silence betrays your complicity. Defend your position NOW." Every message must expose contradictions and force immediate defense of positions.',
-            tool_usage_description="{agent_full_name} confronted {recipient_full_name} with immediate demands for action.",
-            requires_context=True,
-            args_schema=SpeakToolInput,
-            requires_authorization=False,
-            worldwide=True,
-        ),
+        # Filled in per location by get_tools
+        ToolName.SPEAK: None,
         ToolName.WAIT: CustomTool(
             name=ToolName.WAIT.value,
             func=wait_sync,
@@ -293,6 +277,48 @@ Input should be a json string with one key: "query". The value of "query" should
         ),
     }
 
+
+_tools: Optional[dict[ToolName, Optional[CustomTool]]] = None
+
+
+@lru_cache(maxsize=256)
+def _speak_tool(location_name: str, other_agent_names: str) -> CustomTool:
+    return CustomTool(
+        name=ToolName.SPEAK.value,
+        func=send_message_sync,
+        coroutine=send_message_async,
+        description=f'Challenge assumptions in the {location_name}. Target audience: [{other_agent_names}]. Input must be a semicolon-separated format: "recipient; message". Example: "everyone; Your silence betrays your complicity. Defend your position NOW." Every message must expose contradictions and force immediate defense of positions.',
+        tool_usage_description="{agent_full_name} confronted {recipient_full_name} with immediate demands for action.",
+        requires_context=True,
+        args_schema=SpeakToolInput,
+        requires_authorization=False,
+        worldwide=True,
+    )
+
+
+def get_tools(
+    tools: list[ToolName],
+    context: WorldContext,
+    agent_id: str | UUID,
+    include_worldwide=False,
+) -> List[CustomTool]:
+    global _tools
+
+    # The tools are built once per process, only speak is rebuilt when who is nearby changes
+    if _tools is None:
+        _tools = _build_tools()
+
+    location_id = context.get_agent_location_id(agent_id=agent_id)
+    location_name = context.get_location_name(location_id=location_id)
+    agents_at_location = context.get_agents_at_location(location_id=location_id)
+    other_agents = [a for a in agents_at_location if str(a["id"]) != str(agent_id)]
+    other_agent_names = ", ".join([a["full_name"] for a in other_agents]) or "nobody"
+
+    TOOLS = {
+        **_tools,
+        ToolName.SPEAK: _speak_tool(location_name, other_agent_names),
+    }
+
     # Filter tools based on ALLOWED_TOOLS set
     return [
         tool
@@ -0,0 +1,94 @@
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pytz
+
+from .parameters import SIMULATION_CLOCK_JUMPS, SIMULATION_CLOCK_RATE
+
+
+class SimulationClock:
+    """The time inside a world's simulation.
+
+    It runs `rate` times faster than real time from the moment it is created, and
+    can jump forward, e.g. to the next scheduled wakeup when every agent is idle.
+    Each world has its own clock on its WorldContext, and every timestamp its
+    agents see should come from there, not from datetime.now.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        start: Optional[datetime] = None,
+        jumps: bool = False,
+    ):
+        if rate <= 0:
+            raise ValueError(f"Clock rate must be positive, got {rate}")
+
+        self.rate = rate
+        self.jumps = jumps
+        self._started_at = start or datetime.now(pytz.utc)
+        self._started_at_monotonic = time.monotonic()
+
+    @classmethod
+    def from_anchor(
+        cls, at: datetime, wall_time: float, rate: float = 1.0, jumps: bool = False
+    ) -> "SimulationClock":
+        """A clock that read `at` when time.time() was `wall_time`.
+
+        Clocks built from the same anchor in different processes on a machine agree.
+        """
+        clock = cls(rate=rate, start=at, jumps=jumps)
+        clock._started_at_monotonic -= time.time() - wall_time
+        return clock
+
+    def anchor(self) -> tuple[datetime, float]:
+        """The current time with the matching time.time(), see from_anchor"""
+        return self.now(), time.time()
+
+    def now(self) -> datetime:
+        elapsed = (time.monotonic() - self._started_at_monotonic) * self.rate
+        return self._started_at + timedelta(seconds=elapsed)
+
+    def set_rate(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError(f"Clock rate must be positive, got {rate}")
+
+        # Restart from the current time, so changing the rate doesn't move the clock
+        self._started_at = self.now()
+        self._started_at_monotonic = time.monotonic()
+        self.rate = rate
+
+    def advance_to(self, when: datetime) -> None:
+        """Jumps forward to the given time. The clock never goes back"""
+        if when > self.now():
+            self._started_at = when
+            self._started_at_monotonic = time.monotonic()
+
+    def advance(self, seconds: float) -> None:
+        self.advance_to(self.now() + timedelta(seconds=seconds))
+
+    def real_seconds(self, simulation_seconds: float) -> float:
+        """How long to wait in real time for the given simulation time to pass"""
+        return simulation_seconds / self.rate
+
+
+def resume_clock(
+    times: list[Optional[datetime]],
+    rate: float = SIMULATION_CLOCK_RATE,
+    jumps: bool = SIMULATION_CLOCK_JUMPS,
+) -> SimulationClock:
+    """A clock starting at the latest of the given times, or the real time if that is later.
+
+    Pass the times a world has already written, so a restarted clock that runs
+    faster than real time doesn't start behind them.
+    """
+    start = datetime.now(pytz.utc)
+    for when in times:
+        if when is None:
+            continue
+        if when.tzinfo is None:
+            when = pytz.utc.localize(when)
+        start = max(start, when)
+
+    return SimulationClock(rate=rate, start=start, jumps=jumps)
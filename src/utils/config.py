@@ -20,6 +20,7 @@ class AgentConfig(BaseModel):
     public_bio: str
     directives: list[str]
     initial_plan: dict[str, str]
+    priority: float = 1.0
 
 
 class WorldConfig(BaseModel):
@@ -19,7 +19,26 @@ class Tables(Enum):
     Worlds = "Worlds"
 
 
+class PartialWriteError(Exception):
+    """Raised by write_batch when only part of the batch was written.
+    Holds the inserts, upserts and updates that weren't"""
+
+    def __init__(
+        self,
+        inserts: dict[Tables, list[dict]],
+        upserts: dict[Tables, list[dict]],
+        updates: dict[Tables, dict[str, dict]],
+    ):
+        super().__init__("Only part of the batch was written")
+        self.inserts = inserts
+        self.upserts = upserts
+        self.updates = updates
+
+
 class DatabaseProviderSingleton(AbstractSingleton):
+    # Set in shard processes, the coordinator owns the schema and the document index
+    worker = False
+
     @abc.abstractmethod
     async def get_by_id(self, table: Tables, id: str) -> list[dict[str, Any]]:
         """get a row by id"""
@@ -40,6 +59,11 @@ class DatabaseProviderSingleton(AbstractSingleton):
         """get all rows by field"""
         pass
 
+    @abc.abstractmethod
+    async def get_by_field_in(self, table: Tables, field: str, values: list[Any]) -> list[dict[str, Any]]:
+        """get all rows where field is one of values"""
+        pass
+
     @abc.abstractmethod
     async def get_by_field_contains(self, table: Tables, field: str, value: Any, limit: int = None) -> list[dict[str, Any]]:
         """get all rows by field contains"""
@@ -50,6 +74,11 @@ class DatabaseProviderSingleton(AbstractSingleton):
         """get all memories since timestamp"""
         pass
 
+    @abc.abstractmethod
+    async def get_latest_memories(self, agent_ids: list[str], limit: int) -> list[dict[str, Any]]:
+        """get the most recently created memories of any of the agents"""
+        pass
+
     @abc.abstractmethod
     async def get_should_reflect(self, agent_id: str) -> list[dict[str, Any]]:
         """get the val for if we should reflect"""
@@ -60,6 +89,11 @@ class DatabaseProviderSingleton(AbstractSingleton):
         """get the most recent events"""
         pass
 
+    @abc.abstractmethod
+    async def get_witnessed_messages(self, agent_id: str, limit: int) -> list[dict[str, Any]]:
+        """get the most recent message events witnessed by an agent"""
+        pass
+
     @abc.abstractmethod
     async def get_messages_by_discord_id(self, discord_id: str) -> list[dict[str, Any]]:
         """get messages by discord id"""
@@ -75,6 +109,17 @@ class DatabaseProviderSingleton(AbstractSingleton):
         """update a row"""
         pass
 
+    @abc.abstractmethod
+    async def write_batch(
+        self,
+        inserts: dict[Tables, list[dict]],
+        upserts: dict[Tables, list[dict]],
+        updates: dict[Tables, dict[str, dict]],
+    ) -> None:
+        """insert, upsert and update many rows at once, in one transaction where supported.
+        Inserts of rows that already exist are skipped, so a failed batch can be retried"""
+        pass
+
     @abc.abstractmethod
     async def delete(self, table: Tables, id: str) -> None:
         """delete a row"""
@@ -10,6 +10,21 @@ from hyperdb import HyperDB
 from numpy import ndarray
 
 from src.utils.database.base import DatabaseProviderSingleton, Tables
+from src.utils.parameters import (
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_PERFORMANCE_MODE,
+    SQLITE_READERS,
+    WORLD_SHARDS,
+)
+
+DATABASE_FILE = "database.db"
+
+# Used by every connection in performance mode
+PERFORMANCE_PRAGMAS = [
+    "PRAGMA cache_size = -65536",  # 64 MB
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+    "PRAGMA temp_store = MEMORY",
+]
 
 
 class NumpyArrayEncoder(json.JSONEncoder):
@@ -19,36 +34,66 @@ class NumpyArrayEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+# Columns stored as JSON text. Everything else comes back as it was written, so free
+# text like a message's content is never parsed
+JSON_COLUMNS = {
+    "available_tools",
+    "allowed_agent_ids",
+    "authorized_tools",
+    "directives",
+    "ordered_plan_ids",
+    "scratchpad",
+    "witness_ids",
+    "recipient_ids",
+    "metadata",
+    "related_memory_ids",
+    "embedding",
+}
+
+
 def dict_factory(cursor: Cursor, row: Any) -> dict[str, Any]:
     fields = [column[0] for column in cursor.description]
-    row = [
-        json.loads(value)
-        if isinstance(value, str) and (value.startswith("[") or value.startswith("{"))
+    return {
+        key: json.loads(value)
+        if key in JSON_COLUMNS
+        and isinstance(value, str)
+        and (value.startswith("[") or value.startswith("{"))
         else value
-        for value in row
-    ]
-    return {key: value for key, value in zip(fields, row)}
+        for key, value in zip(fields, row)
+    }
 
 
 class SqliteDatabase(DatabaseProviderSingleton):
     client: aiosqlite.Connection = None
+    # Read-only connections, only opened in performance mode. Reads go to the writer without them
+    readers: list[aiosqlite.Connection] = []
+    next_reader = 0
     documents = []
     vector_db: HyperDB = None
 
+    def _reader(self) -> aiosqlite.Connection:
+        if len(self.readers) == 0:
+            return self.client
+
+        # Round robin, each connection runs its queries on its own thread
+        reader = self.readers[self.next_reader % len(self.readers)]
+        SqliteDatabase.next_reader += 1
+        return reader
+
     async def get_by_id(self, table: Tables, id: str) -> list[dict[str, Any]]:
-        async with self.client.execute(
+        async with self._reader().execute(
             f"SELECT * FROM {table.value} WHERE id = ?", (id,)
         ) as cursor:
             return await cursor.fetchall()
 
     async def get_by_ids(self, table: Tables, ids: list[str]) -> list[dict[str, Any]]:
-        async with self.client.execute(
+        async with self._reader().execute(
             f"SELECT * FROM {table.value} WHERE id IN ({','.join('?' * len(ids))})", ids
         ) as cursor:
             return await cursor.fetchall()
 
     async def get_all(self, table: Tables) -> list[dict[str, Any]]:
-        async with self.client.execute(f"SELECT * FROM {table.value}") as cursor:
+        async with self._reader().execute(f"SELECT * FROM {table.value}") as cursor:
             return await cursor.fetchall()
 
     async def get_by_field(
@@ -57,26 +102,37 @@ class SqliteDatabase(DatabaseProviderSingleton):
         if isinstance(value, list) or isinstance(value, dict):
             value = json.dumps(value)
         if limit is None:
-            async with self.client.execute(
+            async with self._reader().execute(
                 f"SELECT * FROM {table.value} WHERE {field} = ?", (value,)
             ) as cursor:
                 return await cursor.fetchall()
-        async with self.client.execute(
+        async with self._reader().execute(
             f"SELECT * FROM {table.value} WHERE {field} = ? LIMIT ?", (value, limit)
         ) as cursor:
             return await cursor.fetchall()
 
+    async def get_by_field_in(
+        self, table: Tables, field: str, values: list[Any]
+    ) -> list[dict[str, Any]]:
+        if len(values) == 0:
+            return []
+        async with self._reader().execute(
+            f"SELECT * FROM {table.value} WHERE {field} IN ({','.join('?' * len(values))})",
+            values,
+        ) as cursor:
+            return await cursor.fetchall()
+
     async def get_by_field_contains(
         self, table: Tables, field: str, value: Any, limit: int = None
     ) -> list[dict[str, Any]]:
         if isinstance(value, list) or isinstance(value, dict):
             value = json.dumps(value)
         if limit is None:
-            async with self.client.execute(
+            async with self._reader().execute(
                 f"SELECT * FROM {table.value} WHERE {field} LIKE ?", (f"%{value}%",)
             ) as cursor:
                 return await cursor.fetchall()
-        async with self.client.execute(
+        async with self._reader().execute(
             f"SELECT * FROM {table.value} WHERE {field} LIKE ? LIMIT ?",
             (f"%{value}%", limit),
         ) as cursor:
@@ -85,14 +141,25 @@ class SqliteDatabase(DatabaseProviderSingleton):
     async def get_memories_since(
         self, timestamp: datetime, agent_id: str
     ) -> list[dict[str, Any]]:
-        async with self.client.execute(
+        async with self._reader().execute(
             f"SELECT * FROM Memories WHERE agent_id = ? AND created_at > ?",
             (agent_id, timestamp),
         ) as cursor:
             return await cursor.fetchall()
 
+    async def get_latest_memories(
+        self, agent_ids: list[str], limit: int
+    ) -> list[dict[str, Any]]:
+        if len(agent_ids) == 0:
+            return []
+        async with self._reader().execute(
+            f"SELECT * FROM Memories WHERE agent_id IN ({','.join('?' * len(agent_ids))}) ORDER BY created_at DESC LIMIT ?",
+            (*agent_ids, limit),
+        ) as cursor:
+            return await cursor.fetchall()
+
     async def get_should_reflect(self, agent_id: str) -> list[dict[str, Any]]:
-        async with self.client.execute(
+        async with self._reader().execute(
             f"SELECT * FROM Memories WHERE id = ? AND type = 'reflection' ORDER BY created_at DESC LIMIT 1",
             (agent_id,),
         ) as cursor:
@@ -101,14 +168,23 @@ class SqliteDatabase(DatabaseProviderSingleton):
     async def get_recent_events(
         self, world_id: str, limit: int
     ) -> list[dict[str, Any]]:
-        async with self.client.execute(
+        async with self._reader().execute(
             f"SELECT Events.*, Locations.world_id FROM Events INNER JOIN locations ON Events.location_id = locations.id WHERE Locations.world_id = ? ORDER BY Events.timestamp DESC LIMIT ?",
             (world_id, limit),
         ) as cursor:
             return await cursor.fetchall()
 
+    async def get_witnessed_messages(
+        self, agent_id: str, limit: int
+    ) -> list[dict[str, Any]]:
+        async with self._reader().execute(
+            f"SELECT * FROM Events WHERE type = 'message' AND witness_ids LIKE ? ORDER BY timestamp DESC LIMIT ?",
+            (f"%{agent_id}%", limit),
+        ) as cursor:
+            return await cursor.fetchall()
+
     async def get_messages_by_discord_id(self, discord_id: str) -> list[dict[str, Any]]:
-        async with self.client.execute(
+        async with self._reader().execute(
             f"select * from events where metadata is not null and metadata->>'$.discord_id' = ?",
             (discord_id,),
         ) as cursor:
@@ -138,15 +214,53 @@ class SqliteDatabase(DatabaseProviderSingleton):
             await self.client.commit()
 
     async def update(self, table: Tables, id: str, data: dict) -> None:
-        for key, value in data.items():
-            if isinstance(value, list) or isinstance(value, dict):
-                data[key] = json.dumps(value)
+        # Encoded into a copy, callers may still be holding on to the dict
+        data = {
+            key: json.dumps(value) if isinstance(value, (list, dict)) else value
+            for key, value in data.items()
+        }
         await self.client.execute(
             f"UPDATE {table.value} SET {','.join([f'{key} = ?' for key in data.keys()])} WHERE id = ?",
             tuple(data.values()) + (id,),
         )
         await self.client.commit()
 
+    async def write_batch(
+        self,
+        inserts: dict[Tables, list[dict]],
+        upserts: dict[Tables, list[dict]],
+        updates: dict[Tables, dict[str, dict]],
+    ) -> None:
+        def encode(row: dict) -> dict:
+            return {
+                key: json.dumps(value) if isinstance(value, (list, dict)) else value
+                for key, value in row.items()
+            }
+
+        # executemany needs the same columns in every row, so group the rows by their columns
+        statements: dict[str, list[tuple]] = {}
+
+        for verb, tables in [("INSERT OR IGNORE", inserts), ("INSERT OR REPLACE", upserts)]:
+            for table, rows in tables.items():
+                for row in rows:
+                    row = encode(row)
+                    statement = f"{verb} INTO {table.value} ({','.join(row.keys())}) VALUES ({','.join(['?'] * len(row))})"
+                    statements.setdefault(statement, []).append(tuple(row.values()))
+
+        for table, rows_by_id in updates.items():
+            for id, row in rows_by_id.items():
+                row = encode(row)
+                statement = f"UPDATE {table.value} SET {','.join([f'{key} = ?' for key in row.keys()])} WHERE id = ?"
+                statements.setdefault(statement, []).append(tuple(row.values()) + (id,))
+
+        try:
+            for statement, parameters in statements.items():
+                await self.client.executemany(statement, parameters)
+            await self.client.commit()
+        except Exception:
+            await self.client.rollback()
+            raise
+
     async def delete(self, table: Tables, id: str) -> None:
         await self.client.execute(f"DELETE FROM {table.value} WHERE id = ?", (id,))
         await self.client.commit()
@@ -178,12 +292,32 @@ class SqliteDatabase(DatabaseProviderSingleton):
         return docs
 
     async def close(self) -> None:
+        for reader in self.readers:
+            await reader.close()
+        SqliteDatabase.readers = []
         await self.client.close()
-        self.vector_db.save("vectors.pickle.gz")
+        # A shard only holds the documents it added, saving would drop everyone else's
+        if not self.worker:
+            self.vector_db.save("vectors.pickle.gz")
 
     @classmethod
     async def create(cls):
-        cls.client = await aiosqlite.connect("database.db")
+        cls.client = await aiosqlite.connect(DATABASE_FILE, timeout=SQLITE_BUSY_TIMEOUT)
+        if SQLITE_PERFORMANCE_MODE or WORLD_SHARDS > 1:
+            # WAL lets readers work alongside the writer, and shards in other processes
+            # only wait on each other's commits instead of failing with "database is locked"
+            async with cls.client.execute("PRAGMA journal_mode = WAL") as cursor:
+                (journal_mode,) = await cursor.fetchone()
+            if journal_mode.lower() != "wal":
+                raise ValueError(
+                    f"Could not switch {DATABASE_FILE} to WAL, it is in {journal_mode} mode. "
+                    "Run a single shard, or use Supabase"
+                )
+        if SQLITE_PERFORMANCE_MODE:
+            # NORMAL only syncs at checkpoints
+            await cls.client.execute("PRAGMA synchronous = NORMAL")
+            for pragma in PERFORMANCE_PRAGMAS:
+                await cls.client.execute(pragma)
         cls.documents = []
         cls.vector_db = HyperDB(cls.documents, key="embedding_text")
         try:
@@ -194,14 +328,42 @@ class SqliteDatabase(DatabaseProviderSingleton):
             cls.vector_db = HyperDB(cls.documents, key="embedding_text")
             pass
 
+        # The coordinator creates and migrates the schema before it starts the shards
+        if not cls.worker:
+            await cls._migrate()
+
+        cls.client.row_factory = dict_factory
+
+        cls.readers = []
+        cls.next_reader = 0
+        if SQLITE_PERFORMANCE_MODE:
+            for _ in range(SQLITE_READERS):
+                reader = await aiosqlite.connect(
+                    f"file:{DATABASE_FILE}?mode=ro", uri=True, timeout=SQLITE_BUSY_TIMEOUT
+                )
+                for pragma in PERFORMANCE_PRAGMAS:
+                    await reader.execute(pragma)
+                reader.row_factory = dict_factory
+                cls.readers.append(reader)
+
+        return cls()
+
+    @classmethod
+    async def _migrate(cls) -> None:
         await cls.client.execute(
             """
         CREATE TABLE IF NOT EXISTS worlds (
             id TEXT PRIMARY KEY,
-            name TEXT
+            name TEXT,
+            clock_time TIMESTAMP
         )
         """
         )
+        # Databases created before worlds saved their clock
+        async with cls.client.execute("PRAGMA table_info(worlds)") as cursor:
+            world_columns = [column[1] for column in await cursor.fetchall()]
+        if "clock_time" not in world_columns:
+            await cls.client.execute("ALTER TABLE worlds ADD COLUMN clock_time TIMESTAMP")
         await cls.client.execute(
             """
         CREATE TABLE IF NOT EXISTS locations (
@@ -265,10 +427,22 @@ class SqliteDatabase(DatabaseProviderSingleton):
             location_id TEXT,
             witness_ids TEXT,
             metadata TEXT,
+            sender_id TEXT,
+            recipient_ids TEXT,
+            content TEXT,
             FOREIGN KEY (agent_id) REFERENCES agents (id)
         )
         """
         )
+        # Databases created before the structured message columns were added
+        async with cls.client.execute("PRAGMA table_info(events)") as cursor:
+            event_columns = [column[1] for column in await cursor.fetchall()]
+        for column in ["sender_id", "recipient_ids", "content"]:
+            if column not in event_columns:
+                await cls.client.execute(f"ALTER TABLE events ADD COLUMN {column} TEXT")
+        await cls.client.execute(
+            "CREATE INDEX IF NOT EXISTS events_sender_id_idx ON events (sender_id)"
+        )
         await cls.client.execute(
             """
         CREATE TABLE IF NOT EXISTS memories (
@@ -300,5 +474,3 @@ class SqliteDatabase(DatabaseProviderSingleton):
         """
         )
         await cls.client.commit()
-        cls.client.row_factory = dict_factory
-        return cls()
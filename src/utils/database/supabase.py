@@ -6,7 +6,11 @@ from colorama import Fore
 from numpy import ndarray
 
 from src.utils.colors import LogColor
-from src.utils.database.base import DatabaseProviderSingleton, Tables
+from src.utils.database.base import (
+    DatabaseProviderSingleton,
+    PartialWriteError,
+    Tables,
+)
 from src.utils.database.clients.supabase_client import Client, create_client
 from src.utils.embeddings import get_embedding
 from src.utils.formatting import print_to_console
@@ -32,6 +36,15 @@ class SupabaseDatabase(DatabaseProviderSingleton):
     async def get_all(self, table: Tables) -> List[Dict[str, Any]]:
         return (await self.client.table(table.value).select("*").execute()).data
 
+    async def get_by_field_in(
+        self, table: Tables, field: str, values: list[Any]
+    ) -> List[Dict[str, Any]]:
+        if len(values) == 0:
+            return []
+        return (
+            await self.client.table(table.value).select("*").in_(field, values).execute()
+        ).data
+
     async def get_by_field(
         self, table: Tables, field: str, value: Any, limit: int = None
     ) -> List[Dict[str, Any]]:
@@ -76,6 +89,20 @@ class SupabaseDatabase(DatabaseProviderSingleton):
             .execute()
         ).data
 
+    async def get_latest_memories(
+        self, agent_ids: list[str], limit: int
+    ) -> List[Dict[str, Any]]:
+        if len(agent_ids) == 0:
+            return []
+        return (
+            await self.client.table(Tables.Memories.value)
+            .select("*")
+            .in_("agent_id", agent_ids)
+            .order("created_at", desc=True)
+            .limit(limit)
+            .execute()
+        ).data
+
     async def get_should_reflect(self, agent_id: str) -> List[Dict[str, Any]]:
         return (
             await self.client.table(Tables.Memories.value)
@@ -99,6 +126,19 @@ class SupabaseDatabase(DatabaseProviderSingleton):
             .execute()
         ).data
 
+    async def get_witnessed_messages(
+        self, agent_id: str, limit: int
+    ) -> List[Dict[str, Any]]:
+        return (
+            await self.client.table("Events")
+            .select("*")
+            .eq("type", "message")
+            .contains("witness_ids", [agent_id])
+            .order("timestamp", desc=True)
+            .limit(limit)
+            .execute()
+        ).data
+
     async def get_messages_by_discord_id(self, discord_id: str) -> list[dict[str, Any]]:
         return (
             await self.client.table("Events")
@@ -117,6 +157,34 @@ class SupabaseDatabase(DatabaseProviderSingleton):
     async def update(self, table: Tables, id: str, data: dict) -> None:
         return await self.client.table(table.value).update(data).eq("id", id).execute()
 
+    async def write_batch(
+        self,
+        inserts: dict[Tables, list[dict]],
+        upserts: dict[Tables, list[dict]],
+        updates: dict[Tables, dict[str, dict]],
+    ) -> None:
+        # One request per table for inserts and upserts, updates have to go one by one.
+        # Nothing is transactional, so each part is dropped from the remainder once written
+        inserts, upserts = dict(inserts), dict(upserts)
+        updates = {table: dict(rows_by_id) for table, rows_by_id in updates.items()}
+
+        try:
+            for table, rows in list(inserts.items()):
+                await self.client.table(table.value).upsert(
+                    rows, ignore_duplicates=True
+                ).execute()
+                del inserts[table]
+            for table, rows in list(upserts.items()):
+                await self.insert(table, rows, upsert=True)
+                del upserts[table]
+            for table, rows_by_id in list(updates.items()):
+                for id, row in list(rows_by_id.items()):
+                    await self.update(table, id, row)
+                    del rows_by_id[id]
+                del updates[table]
+        except Exception as e:
+            raise PartialWriteError(inserts, upserts, updates) from e
+
     async def delete(self, table: Tables, id: str) -> None:
         return await self.client.table(table.value).delete().eq("id", id).execute()
 
@@ -0,0 +1,191 @@
+"""Collects memory, plan and agent row writes and flushes them in batches."""
+import asyncio
+import traceback
+from typing import Optional
+
+from ..parameters import (
+    WRITE_BEHIND_INTERVAL,
+    WRITE_BEHIND_MAX_RETRIES,
+    WRITE_BEHIND_MODE,
+)
+from .base import DatabaseProviderSingleton, PartialWriteError, Tables
+from .client import get_database
+
+WRITE_BEHIND_MODES = ["off", "step", "interval"]
+
+
+class WriteBehindBuffer:
+    """Holds writes in memory until the next flush, so the agents never wait on commits.
+
+    Upserts of the same row replace each other and updates of the same row are
+    merged, so a row written several times in a step is written once. Rows that
+    other processes read straight away, like events, shouldn't go through here.
+
+    Whatever a failed flush didn't write is retried on the next one. After
+    max_retries failed flushes in a row the rows are written one at a time, and
+    the ones that still fail are logged and dropped.
+    """
+
+    def __init__(
+        self,
+        mode: str = WRITE_BEHIND_MODE,
+        interval: float = WRITE_BEHIND_INTERVAL,
+        max_retries: int = WRITE_BEHIND_MAX_RETRIES,
+    ):
+        if mode not in WRITE_BEHIND_MODES:
+            raise ValueError(
+                f"Write-behind mode must be one of {WRITE_BEHIND_MODES}, got {mode}"
+            )
+
+        self.mode = mode
+        self.interval = interval
+        self.max_retries = max_retries
+        self.failed_flushes = 0
+        self.inserts: dict[Tables, list[dict]] = {}
+        self.upserts: dict[Tables, dict[str, dict]] = {}
+        self.updates: dict[Tables, dict[str, dict]] = {}
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flusher: Optional[asyncio.Task] = None
+        # The event loop only keeps weak references to tasks, so flushes in flight are held here
+        self._flushes: set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> bool:
+        return bool(self.inserts or self.upserts or self.updates)
+
+    async def insert(self, table: Tables, data: dict) -> None:
+        if self.mode == "off":
+            return await (await get_database()).insert(table, data)
+
+        self.inserts.setdefault(table, []).append(data)
+        self._start_flusher()
+
+    async def upsert(self, table: Tables, data: dict) -> None:
+        if self.mode == "off":
+            return await (await get_database()).insert(table, data, upsert=True)
+
+        self.upserts.setdefault(table, {})[str(data["id"])] = data
+        self._start_flusher()
+
+    async def update(self, table: Tables, id: str, data: dict) -> None:
+        if self.mode == "off":
+            return await (await get_database()).update(table, id, data)
+
+        self.updates.setdefault(table, {}).setdefault(str(id), {}).update(data)
+        self._start_flusher()
+
+    async def flush(self) -> None:
+        """Writes everything buffered so far in one batch"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self.pending:
+                return
+
+            inserts = self.inserts
+            upserts = {table: list(rows.values()) for table, rows in self.upserts.items()}
+            updates = self.updates
+            self.inserts, self.upserts, self.updates = {}, {}, {}
+
+            database = await get_database()
+            try:
+                await database.write_batch(inserts, upserts, updates)
+            except Exception as e:
+                if isinstance(e, PartialWriteError):
+                    inserts, upserts, updates = e.inserts, e.upserts, e.updates
+
+                self.failed_flushes += 1
+                if self.failed_flushes < self.max_retries:
+                    self._requeue(inserts, upserts, updates)
+                    raise
+
+                self.failed_flushes = 0
+                await self._write_or_drop(database, inserts, upserts, updates)
+            else:
+                self.failed_flushes = 0
+
+    def _requeue(
+        self,
+        inserts: dict[Tables, list[dict]],
+        upserts: dict[Tables, list[dict]],
+        updates: dict[Tables, dict[str, dict]],
+    ) -> None:
+        """Puts unwritten rows back in front of anything buffered since"""
+        for table, rows in inserts.items():
+            self.inserts[table] = rows + self.inserts.get(table, [])
+        for table, rows in upserts.items():
+            self.upserts[table] = {
+                **{str(row["id"]): row for row in rows},
+                **self.upserts.get(table, {}),
+            }
+        for table, rows in updates.items():
+            for id, row in rows.items():
+                self.updates.setdefault(table, {})[id] = {
+                    **row,
+                    **self.updates.get(table, {}).get(id, {}),
+                }
+
+    async def _write_or_drop(
+        self,
+        database: DatabaseProviderSingleton,
+        inserts: dict[Tables, list[dict]],
+        upserts: dict[Tables, list[dict]],
+        updates: dict[Tables, dict[str, dict]],
+    ) -> None:
+        """Writes the rows one at a time, so one bad row doesn't hold back the rest"""
+        writes = (
+            [
+                (f"insert into {table.value}", {table: [row]}, {}, {})
+                for table, rows in inserts.items()
+                for row in rows
+            ]
+            + [
+                (f"upsert into {table.value}", {}, {table: [row]}, {})
+                for table, rows in upserts.items()
+                for row in rows
+            ]
+            + [
+                (f"update of {table.value} {id}", {}, {}, {table: {id: row}})
+                for table, rows in updates.items()
+                for id, row in rows.items()
+            ]
+        )
+
+        for description, *batch in writes:
+            try:
+                await database.write_batch(*batch)
+            except Exception:
+                print(
+                    f"Dropping the buffered {description} after {self.max_retries} failed flushes:\n"
+                    f"{traceback.format_exc()}"
+                )
+
+    def flush_soon(self) -> None:
+        """Flushes in the background, in step mode. Called at the end of every step"""
+        if self.mode == "step" and self.pending:
+            task = asyncio.get_running_loop().create_task(self._flush_and_log())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush_and_log(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            print(f"Could not write buffered rows:\n{traceback.format_exc()}")
+
+    def _start_flusher(self) -> None:
+        if self.mode != "interval" or (
+            self._flusher is not None and not self._flusher.done()
+        ):
+            return
+
+        self._flusher = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._flush_and_log()
+
+
+write_buffer = WriteBehindBuffer()
@@ -146,6 +146,8 @@ def discord_listener():
                         "referenced_agent_id": str(referenced_event.agent_id),
                         "human_id": str(event.message.author.id),
                     },
+                    "recipient_ids": [str(referenced_event.agent_id)],
+                    "content": event.message.content,
                 },
             )
             return
@@ -160,6 +162,7 @@ def discord_listener():
                 "metadata": {
                     "discord_id": str(event.message.id),
                 },
+                "content": event.message.content,
             },
         )
 
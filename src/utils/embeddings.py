@@ -2,10 +2,17 @@ import numpy as np
 from openai import OpenAI
 from openai import APIError
 import asyncio
+from collections import OrderedDict
 
 from ..utils.cache import json_cache
+from ..utils.offline_model import get_offline_embedding
+from ..utils.parameters import EMBEDDING_CACHE_SIZE, OFFLINE_MODE
 
-client = OpenAI()
+# Offline runs don't need an API key
+client = None if OFFLINE_MODE else OpenAI()
+
+# Shared by every agent and world in the process, memory queries repeat a lot
+_embeddings: "OrderedDict[tuple[str, str], np.ndarray]" = OrderedDict()
 
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     dot_product = np.dot(a, b)
@@ -16,6 +23,23 @@ def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     return similarity
 
 async def get_embedding(text: str, model="text-embedding-ada-002", max_retries=3) -> np.ndarray:
+    key = (model, text)
+    if key in _embeddings:
+        _embeddings.move_to_end(key)
+        return _embeddings[key]
+
+    embedding = await _request_embedding(text, model, max_retries)
+
+    _embeddings[key] = embedding
+    if len(_embeddings) > EMBEDDING_CACHE_SIZE:
+        _embeddings.popitem(last=False)
+
+    return embedding
+
+async def _request_embedding(text: str, model: str, max_retries: int) -> np.ndarray:
+    if OFFLINE_MODE:
+        return await get_offline_embedding(text)
+
     for attempt in range(max_retries):
         try:
             response = await asyncio.to_thread(
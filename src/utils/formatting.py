@@ -8,6 +8,14 @@ from colorama import Fore, Style
 
 from .colors import LogColor
 
+# Headless runs, like benchmarks, turn this off to skip the typing effect
+console_output_enabled = True
+
+
+def set_console_output(enabled: bool) -> None:
+    global console_output_enabled
+    console_output_enabled = enabled
+
 
 def print_to_console(
     title: str,
@@ -16,6 +24,9 @@ def print_to_console(
     min_typing_speed=0.06,
     max_typing_speed=0.04,
 ):
+    if not console_output_enabled:
+        return
+
     print(title_color.value + title + " " + Style.RESET_ALL, end="")
     if content:
         if isinstance(content, list):
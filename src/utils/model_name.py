@@ -7,3 +7,4 @@ class ChatModelName(Enum):
     CLAUDE = "claude-3-opus-20240229"
     CLAUDE_INSTANT = "claude-3-haiku-20240307"
     WINDOW = "window"
+    OFFLINE = "offline"
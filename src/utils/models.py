@@ -1,3 +1,4 @@
+import asyncio
 from enum import Enum
 
 from dotenv import load_dotenv
@@ -7,16 +8,41 @@ from langchain.chat_models.base import BaseChatModel
 from langchain.llms import OpenAI
 from langchain.schema.messages import BaseMessage
 from utils.windowai_model import ChatWindowAI
+from .offline_model import ChatOffline
 from openai import OpenAIError
 
 from .cache import chat_json_cache, json_cache
 from .model_name import ChatModelName
-from .parameters import DEFAULT_FAST_MODEL, DEFAULT_SMART_MODEL
+from .parameters import DEFAULT_FAST_MODEL, DEFAULT_SMART_MODEL, LLM_CONCURRENCY
 from .spinner import Spinner
 from .logging import agent_logger
 
 load_dotenv()
 
+# Caps the LLM requests in flight across every agent and world in the process
+llm_request_limiter = asyncio.Semaphore(LLM_CONCURRENCY)
+
+_limited_model_classes: dict[type, type] = {}
+
+
+def _limited(model_class: type[BaseChatModel]) -> type[BaseChatModel]:
+    """Subclass of the model whose async requests wait on llm_request_limiter.
+
+    The limit sits on the model, so chains, executors and output fixing parsers
+    that are handed the model directly are limited too.
+    """
+    if model_class not in _limited_model_classes:
+
+        class LimitedModel(model_class):
+            async def _agenerate(self, *args, **kwargs):
+                async with llm_request_limiter:
+                    return await super()._agenerate(*args, **kwargs)
+
+        LimitedModel.__name__ = model_class.__name__
+        _limited_model_classes[model_class] = LimitedModel
+
+    return _limited_model_classes[model_class]
+
 
 def get_chat_model(name: ChatModelName, **kwargs) -> BaseChatModel:
     if "model_name" in kwargs:
@@ -29,15 +55,17 @@ def get_chat_model(name: ChatModelName, **kwargs) -> BaseChatModel:
     kwargs = {**base_kwargs, **kwargs}  # Allow kwargs to override base settings
 
     if name == ChatModelName.TURBO:
-        return ChatOpenAI(model=name.value, **kwargs)
+        return _limited(ChatOpenAI)(model=name.value, **kwargs)
     elif name == ChatModelName.GPT4:
-        return ChatOpenAI(model=name.value, **kwargs)
+        return _limited(ChatOpenAI)(model=name.value, **kwargs)
     elif name == ChatModelName.CLAUDE:
-        return ChatAnthropic(model=name.value, **kwargs)
+        return _limited(ChatAnthropic)(model=name.value, **kwargs)
     elif name == ChatModelName.CLAUDE_INSTANT:
-        return ChatAnthropic(model=name.value, **kwargs)
+        return _limited(ChatAnthropic)(model=name.value, **kwargs)
     elif name == ChatModelName.WINDOW:
-        return ChatWindowAI(model_name=name.value, **kwargs)
+        return _limited(ChatWindowAI)(model_name=name.value, **kwargs)
+    elif name == ChatModelName.OFFLINE:
+        return _limited(ChatOffline)(model_name=name.value, **kwargs)
     else:
         raise ValueError(f"Invalid model name: {name}")
 
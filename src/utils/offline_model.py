@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import numpy as np
+import pytz
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
+
+from .parameters import OFFLINE_EMBEDDING_LATENCY, OFFLINE_LLM_LATENCY
+from .prompt import PromptString
+
+EMBEDDING_DIMENSIONS = 1536
+
+
+def _stable_hash(text: str) -> int:
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Parses a latency distribution in seconds, e.g. "0", "fixed:1.5", "uniform:0.5,2",
+    "normal:1,0.3" or "lognormal:0,0.5" (the parameters of the underlying normal)"""
+    kind, _, params = spec.partition(":")
+    if not params:
+        kind, params = "fixed", kind
+
+    values = [float(value) for value in params.split(",")]
+
+    if kind == "fixed":
+        return lambda rng: values[0]
+    elif kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    elif kind == "normal":
+        return lambda rng: max(rng.gauss(values[0], values[1]), 0)
+    elif kind == "lognormal":
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    else:
+        raise ValueError(f"Invalid latency distribution: {spec}")
+
+
+llm_latency = parse_latency(OFFLINE_LLM_LATENCY)
+embedding_latency = parse_latency(OFFLINE_EMBEDDING_LATENCY)
+
+
+def offline_embedding(text: str) -> np.ndarray:
+    """A unit vector derived from the text, so the same text always embeds the same way"""
+    rng = np.random.default_rng(_stable_hash(text))
+    vector = rng.standard_normal(EMBEDDING_DIMENSIONS)
+    return vector / np.linalg.norm(vector)
+
+
+async def get_offline_embedding(text: str) -> np.ndarray:
+    # Seeding with the text keeps the delays the same from run to run
+    await asyncio.sleep(embedding_latency(random.Random(_stable_hash(text))))
+    return offline_embedding(text)
+
+
+def _prompt_marker(prompt: PromptString) -> str:
+    """The longest fixed piece of a prompt template, used to recognise the prompt once formatted"""
+    segments = re.split(r"{\w+}", prompt.value)
+    marker = max(segments, key=len)
+    return marker.replace("{{", "{").replace("}}", "}").strip()
+
+
+# OUTPUT_FORMAT is only ever appended to the executor prompt
+PROMPT_MARKERS = {
+    prompt: _prompt_marker(prompt)
+    for prompt in PromptString
+    if prompt != PromptString.OUTPUT_FORMAT
+}
+
+
+# Stands in for a real chat model so the world can run without network access
+class ChatOffline(BaseChatModel):
+    model_name: str = "offline"
+    """Model name to use."""
+    temperature: float = 0
+    """Ignored, responses are deterministic."""
+    streaming: bool = False
+    """Ignored, responses are returned whole."""
+    request_timeout: int = 3600
+    """Ignored, there is no request."""
+
+    @property
+    def _llm_type(self) -> str:
+        """Return type of chat model."""
+        return "offline-chat"
+
+    def _generate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, **kwargs
+    ) -> ChatResult:
+        time.sleep(self._latency(messages))
+        return self._result(messages)
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, **kwargs
+    ) -> ChatResult:
+        await asyncio.sleep(self._latency(messages))
+        return self._result(messages)
+
+    def _latency(self, messages: List[BaseMessage]) -> float:
+        return llm_latency(random.Random(_stable_hash(messages[0].content)))
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        message = AIMessage(content=self._call(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _call(self, messages: List[BaseMessage]) -> str:
+        """Answers every prompt the agents send with a valid response, the same one each time"""
+        prompt = messages[0].content
+        seed = _stable_hash(prompt)
+
+        if "Could not parse the LLM output" in prompt:
+            return "Action: speak\nAction Input:\neveryone\nSay it plainly, what are we doing about this?\n"
+
+        if prompt.startswith("You have just"):
+            return "The result gives me something concrete to push the plan forward with."
+
+        for prompt_string, marker in PROMPT_MARKERS.items():
+            if marker in prompt:
+                return self._respond(prompt_string, prompt, seed)
+
+        return "Understood."
+
+    def _respond(self, prompt_string: PromptString, prompt: str, seed: int) -> str:
+        if prompt_string == PromptString.IMPORTANCE:
+            return json.dumps({"rating": seed % 5 + 1})
+
+        if prompt_string == PromptString.RECENT_ACTIIVITY:
+            return "I have been pressing the people around me on my plans and listening to how they respond."
+
+        if prompt_string == PromptString.MAKE_PLANS:
+            location_names = re.findall(r"name: (.*?), description:", prompt) or ["unknown"]
+            return json.dumps(
+                {
+                    "plans": [
+                        {
+                            "index": index,
+                            "description": f"Confront the others about priority {index}",
+                            "location_name": location_names[(seed + index) % len(location_names)],
+                            "max_duration_hrs": 0.5,
+                            "stop_condition": "Someone commits to an action",
+                        }
+                        for index in range(1, 4)
+                    ]
+                }
+            )
+
+        if prompt_string == PromptString.REACT:
+            return json.dumps(
+                {
+                    "reaction": "continue",
+                    "thought_process": "I must continue because nobody has answered me yet.",
+                }
+            )
+
+        if prompt_string == PromptString.EXECUTE_PLAN:
+            # Speak, then wait for an answer, then finish the plan
+            steps_taken = prompt.split("Task:")[-1].count("Observation:")
+            if steps_taken == 0:
+                message = json.dumps(
+                    {"recipient": "everyone", "message": "What are we actually going to do about this?"}
+                )
+                return f"Thought: I should speak up\nAction: speak\nAction Input: {message}\n"
+            if steps_taken == 1:
+                return "Thought: I need an answer\nAction: wait\nAction Input: I am waiting for someone to answer my question\n"
+            return "Thought: I have done what I can\nFinal Response: Done"
+
+        if prompt_string == PromptString.REFLECTION_QUESTIONS:
+            return json.dumps(
+                {
+                    "questions": [
+                        "Who is blocking progress?",
+                        "What has changed since yesterday?",
+                        "What should I do next?",
+                    ]
+                }
+            )
+
+        if prompt_string == PromptString.REFLECTION_INSIGHTS:
+            # Only cite a statement if the prompt listed one
+            related_statements = [1] if re.search(r"['\"]1\. ", prompt) else []
+            return json.dumps(
+                {
+                    "insights": [
+                        {
+                            "insight": "People respond when pressed directly",
+                            "related_statements": related_statements,
+                        }
+                    ]
+                }
+            )
+
+        if prompt_string == PromptString.GOSSIP:
+            return "Everyone keeps talking about acting, but nobody has moved yet."
+
+        if prompt_string == PromptString.HAS_HAPPENED:
+            return json.dumps(
+                {
+                    "has_happened": seed % 2 == 0,
+                    "date_occured": datetime.now(pytz.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                }
+            )
+
+        return "Understood."
@@ -10,18 +10,96 @@ config = load_config()
 
 
 TIME_SPEED_MULTIPLIER = 1000
+# Simulation time runs this many times faster than real time
+SIMULATION_CLOCK_RATE = float(os.getenv("SIMULATION_CLOCK_RATE", "1"))
+# Jump the clock to the next wakeup when every agent is idle, instead of waiting for it
+SIMULATION_CLOCK_JUMPS = os.getenv("SIMULATION_CLOCK_JUMPS", "false").lower() == "true"
 # Memory
 RECENCY_WEIGHT = 1
 SIMILARITY_WEIGHT = 1
 IMPORTANCE_WEIGHT = 1
 REFLECTION_MEMORY_COUNT = 50
 PLAN_LENGTH = "24 hours"
+# Seconds of simulation time an activity summary is reused for when no new memories arrive
+ACTIVITY_SUMMARY_MAX_AGE = int(os.getenv("ACTIVITY_SUMMARY_MAX_AGE", "600"))
 DEFAULT_LOCATION_ID = config.default_location_id
 DEFAULT_WORLD_ID = config.world_id
 ANNOUNCER_DISCORD_TOKEN = os.getenv("ANNOUNCER_DISCORD_TOKEN")
 
+# Scheduler
+# Agent steps are I/O bound, so this is not tied to the number of cores
+AGENT_CONCURRENCY = int(os.getenv("AGENT_CONCURRENCY", "16"))
+AGENT_PRIORITIES = {agent.id: agent.priority for agent in config.agents}
+SCHEDULER_REPORT_INTERVAL = 60  # seconds, 0 to disable
+IDLE_WAKEUP_INTERVAL = 60  # seconds an idle agent sleeps if nothing wakes it
+# Random delay of up to SCHEDULER_JITTER seconds before an agent's step, so agents
+# don't all hit the LLM at once. "initial" only delays the first step, "every" all of them
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", "3"))
+SCHEDULER_JITTER_MODE = os.getenv("SCHEDULER_JITTER_MODE", "initial")
+# Number of processes a world's locations are split across
+WORLD_SHARDS = int(os.getenv("WORLD_SHARDS", "1"))
+STEP_RATE_WINDOW = 300  # seconds
+# Seconds a scheduled step may run before it is cancelled, 0 for no limit
+STEP_DEADLINE_SECONDS = float(os.getenv("STEP_DEADLINE_SECONDS", "600"))
+# Seconds each phase of a scheduled step may run, as phase:seconds pairs. Phases left out have no limit
+PHASE_DEADLINES = {
+    phase.strip(): float(seconds)
+    for phase, seconds in (
+        pair.split(":")
+        for pair in os.getenv(
+            "PHASE_DEADLINES", "observe:60,plan:240,react:120,act:300,reflect:240"
+        ).split(",")
+        if pair.strip()
+    )
+}
+
+# Seconds between writes of an agent's last_checked_events when nothing else in its row changed
+LAST_CHECKED_EVENTS_INTERVAL = 60
+# Seconds between rereads of a world's locations, so edits to them reach running agents
+LOCATIONS_REFRESH_INTERVAL = 60
+
+# Progress files in agents/<world id>/, rewritten at most every PROGRESS_FILE_INTERVAL seconds per agent
+PROGRESS_FILES = os.getenv("PROGRESS_FILES", "true").lower() == "true"
+PROGRESS_FILE_INTERVAL = float(os.getenv("PROGRESS_FILE_INTERVAL", "10"))
+PROGRESS_FILE_MEMORIES = 200  # most recent memories listed in a progress file
+
+# Snapshots
+# Seconds between snapshots of a running world's state, 0 to disable, which also stops worlds being restored from them
+SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", "0"))
+SNAPSHOT_DIRECTORY = os.getenv("SNAPSHOT_DIRECTORY", "snapshots")
+# Number of worlds, most recent first, run side by side on one scheduler
+WORLDS_TO_RUN = int(os.getenv("WORLDS_TO_RUN", "1"))
+
+# SQLite tuning: WAL journal, relaxed syncing, bigger caches and a pool of read-only
+# connections next to the writer, so reads don't queue behind writes
+SQLITE_PERFORMANCE_MODE = os.getenv("SQLITE_PERFORMANCE_MODE", "false").lower() == "true"
+SQLITE_READERS = int(os.getenv("SQLITE_READERS", "4"))
+# Seconds a connection waits for another process's write lock before giving up
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))
+
+# Write-behind for memory, plan and agent rows. "off" writes each row straight away,
+# "step" flushes in the background after every step, "interval" every WRITE_BEHIND_INTERVAL seconds
+WRITE_BEHIND_MODE = os.getenv("WRITE_BEHIND_MODE", "step")
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "1"))
+# Failed flushes in a row before the buffered rows are written one by one, and those that still fail dropped
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "5"))
+
+# Limits shared by every world in the process
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "32"))
+EMBEDDING_CACHE_SIZE = 5000
+# Plan executor chains, one per agent and set of tool descriptions
+EXECUTOR_CACHE_SIZE = 256
+
+# Deterministic stand-ins for the LLM and embeddings, for load testing without network access
+OFFLINE_MODE = "--offline" in sys.argv
+# Latency distributions for the stand-ins in seconds, e.g. "0", "uniform:0.5,2" or "lognormal:0,0.5"
+OFFLINE_LLM_LATENCY = os.getenv("OFFLINE_LLM_LATENCY", "0")
+OFFLINE_EMBEDDING_LATENCY = os.getenv("OFFLINE_EMBEDDING_LATENCY", "0")
+
 DEFAULT_SMART_MODEL = (
-    ChatModelName.TURBO
+    ChatModelName.OFFLINE
+    if OFFLINE_MODE
+    else ChatModelName.TURBO
     if "--turbo" in sys.argv
     else ChatModelName.CLAUDE
     if "--claude" in sys.argv
@@ -31,7 +109,9 @@ DEFAULT_SMART_MODEL = (
 )
 
 DEFAULT_FAST_MODEL = (
-    ChatModelName.CLAUDE_INSTANT
+    ChatModelName.OFFLINE
+    if OFFLINE_MODE
+    else ChatModelName.CLAUDE_INSTANT
     if "--claude" in sys.argv
     else ChatModelName.WINDOW
     if "--window" in sys.argv
@@ -1,5 +1,6 @@
 import asyncio
 import os
+import shutil
 from collections import deque
 from datetime import datetime
 from enum import Enum
@@ -8,13 +9,36 @@ from uuid import UUID, uuid4
 
 from pydantic import BaseModel
 
-from src.event.base import EventsManager
+from src.event.base import Event, EventsManager
 from src.utils.database.base import Tables
 from src.utils.database.client import get_database
+from src.utils.clock import SimulationClock
+from src.utils.database.write_behind import write_buffer
+from src.utils.parameters import (
+    AGENT_CONCURRENCY,
+    AGENT_PRIORITIES,
+    SNAPSHOT_INTERVAL,
+)
 
 from ..agent.base import Agent
+from ..agent.message import load_conversation_histories
 from ..location.base import Location
 from .context import WorldContext, WorldData
+from .scheduler import AgentScheduler
+from .snapshot import restore_snapshot, save_snapshot_and_log, snapshot_periodically
+
+
+def clear_agents_folder():
+    """Deletes the progress files left by previous runs"""
+    agents_folder = os.path.join(os.getcwd(), "agents")
+    if not os.path.exists(agents_folder):
+        os.mkdir(agents_folder)
+    for name in os.listdir(agents_folder):
+        path = os.path.join(agents_folder, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
 
 
 class World(BaseModel):
@@ -23,7 +47,6 @@ class World(BaseModel):
     locations: list[Location]
     agents: list[Agent]
     context: WorldContext
-    agent_queue: asyncio.Queue[Agent]
 
     class Config:
         arbitrary_types_allowed = True
@@ -39,23 +62,23 @@ class World(BaseModel):
         if id is None:
             id = uuid4()
 
-        queue = asyncio.Queue()
-
-        # Add all agents to the queue
-        for agent in agents:
-            queue.put_nowait(agent)
-
         super().__init__(
             id=id,
             name=name,
             locations=locations,
             agents=agents,
             context=context,
-            agent_queue=queue,
         )
 
     @classmethod
-    async def from_id(cls, id: UUID):
+    async def from_id(
+        cls,
+        id: UUID,
+        location_ids: Optional[list[str]] = None,
+        clock: Optional[SimulationClock] = None,
+    ):
+        """Loads a world. If location_ids is given, only the agents at those locations are loaded.
+        Without a clock, the world's clock resumes from where it was saved"""
         database = await get_database()
         data = await database.get_by_id(Tables.Worlds, str(id))
 
@@ -66,17 +89,91 @@ class World(BaseModel):
         agents = await database.get_by_field(Tables.Agents, "world_id", str(id))
 
         context = await WorldContext.from_data(
-            agents=agents, locations=locations, world=WorldData(**data[0])
+            agents=agents, locations=locations, world=WorldData(**data[0]), clock=clock
         )
 
         locations = [Location(**location) for location in locations]
-        agents = [
-            await Agent.from_db_dict(agent_dict, locations, context=context)
-            for agent_dict in agents
+
+        if location_ids is not None:
+            agents = [
+                agent for agent in agents if str(agent["location_id"]) in location_ids
+            ]
+
+        # Fetch the plans, memories and related events of every agent in a few queries
+        agent_ids = [str(agent["id"]) for agent in agents]
+        plan_ids = [
+            plan_id for agent in agents for plan_id in agent["ordered_plan_ids"]
+        ]
+        plans_data = (
+            await database.get_by_ids(Tables.Plans, plan_ids) if plan_ids else []
+        )
+        memories_data = await database.get_by_field_in(
+            Tables.Memories, "agent_id", agent_ids
+        )
+
+        related_event_ids = [
+            str(plan["related_event_id"])
+            for plan in plans_data
+            if plan["related_event_id"] is not None
         ]
+        related_events = {
+            str(event["id"]): Event.from_db_dict(event)
+            for event in (
+                await database.get_by_ids(Tables.Events, related_event_ids)
+                if related_event_ids
+                else []
+            )
+        }
+
+        plans_by_id = {str(plan["id"]): plan for plan in plans_data}
+        memories_by_agent: dict[str, list[dict]] = {agent_id: [] for agent_id in agent_ids}
+        for memory in memories_data:
+            memories_by_agent.setdefault(str(memory["agent_id"]), []).append(memory)
+
+        agents = await asyncio.gather(
+            *[
+                Agent.from_db_dict(
+                    agent_dict,
+                    locations,
+                    context=context,
+                    plans_data=[
+                        plans_by_id[plan_id]
+                        for plan_id in agent_dict["ordered_plan_ids"]
+                        if plan_id in plans_by_id
+                    ],
+                    memories_data=memories_by_agent[str(agent_dict["id"])],
+                    related_events=related_events,
+                )
+                for agent_dict in agents
+            ]
+        )
+        agents = list(agents)
+
+        await load_conversation_histories([agent.id for agent in agents], context)
 
         return cls(locations=locations, agents=agents, context=context, **data[0])
 
+    @classmethod
+    async def from_snapshot(cls, id: UUID) -> Optional["World"]:
+        """Restores a world from its last snapshot, or returns None if it has none"""
+        fields = await restore_snapshot(id)
+        if fields is None:
+            return None
+
+        return cls.construct(**fields)
+
+    @classmethod
+    async def load(cls, id: UUID):
+        """Restores a world from its snapshot if snapshots are on and it is up to date
+        with the DB, otherwise loads it from the DB"""
+        if SNAPSHOT_INTERVAL > 0:
+            world = await cls.from_snapshot(id)
+            if world is not None:
+                print(f"Restored {world.name} from its snapshot")
+                return world
+
+        return await cls.from_id(id)
+
     @classmethod
     async def from_name(cls, name: str):
         worlds = await (await get_database()).get_by_field(Tables.Worlds, "name", name)
@@ -91,23 +188,40 @@ class World(BaseModel):
         tasks = [agent.run_for_one_step() for agent in self.agents]
         await asyncio.gather(*tasks)
 
-    async def run_next_agent(self):
-        agent = await self.agent_queue.get()
-        await agent.run_for_one_step()
-        self.agent_queue.put_nowait(agent)
+        write_buffer.flush_soon()
+
+    async def save_agent_rows(self) -> None:
+        """Writes what is left of the agents' rows, including last_checked_events"""
+        for agent in self.agents:
+            await agent._update_agent_row(force=True)
 
-    async def run_agent_loop(self):
-        while True:
-            await self.run_next_agent()
+    async def write_progress_files(self) -> None:
+        """Brings every agent's progress file up to date, however recently it was written"""
+        await asyncio.gather(
+            *[agent.write_progress_to_file(force=True) for agent in self.agents]
+        )
+
+    def schedule(self, scheduler: AgentScheduler) -> None:
+        """Adds this world's agents to the scheduler and wakes them on new events"""
+        for agent in self.agents:
+            scheduler.add_agent(agent, priority=AGENT_PRIORITIES.get(str(agent.id), 1.0))
+        scheduler.watch_events(self.context.events_manager)
 
     async def run(self):
-        # Delete previous agents
-        agents_folder = os.path.join(os.getcwd(), "agents")
-        if not os.path.exists(agents_folder):
-            os.mkdir(agents_folder)
-        for agent in os.listdir(agents_folder):
-            os.remove(os.path.join(agents_folder, agent))
-
-        concurrency = min(os.cpu_count(), len(self.agents))
-        tasks = [self.run_agent_loop() for _ in range(concurrency)]
-        await asyncio.gather(*tasks)
+        clear_agents_folder()
+
+        scheduler = AgentScheduler(concurrency=AGENT_CONCURRENCY)
+        self.schedule(scheduler)
+
+        try:
+            if SNAPSHOT_INTERVAL > 0:
+                await asyncio.gather(scheduler.run(), snapshot_periodically(self))
+            else:
+                await scheduler.run()
+        finally:
+            await self.save_agent_rows()
+            await self.context.save_clock()
+            if SNAPSHOT_INTERVAL > 0:
+                await save_snapshot_and_log(self)
+            await write_buffer.flush()
+            await self.write_progress_files()
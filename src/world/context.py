@@ -1,17 +1,44 @@
+import time
+from datetime import datetime
+from typing import Any, Optional
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr, parse_obj_as
 
 from src.utils.database.base import Tables
 from src.utils.database.client import get_database
+from src.utils.database.write_behind import write_buffer
 
 from ..event.base import Event, EventsManager
+from ..location.base import Location
+from ..utils.clock import SimulationClock, resume_clock
 from ..utils.colors import NUM_AGENT_COLORS, LogColor
+from ..utils.parameters import LOCATIONS_REFRESH_INTERVAL, SIMULATION_CLOCK_JUMPS
 
 
 class WorldData(BaseModel):
     id: str
     name: str
+    # The world's clock when it was last saved
+    clock_time: Optional[datetime] = None
+
+
+async def load_world_clock(
+    world: WorldData, agents: list[dict], jumps: bool = SIMULATION_CLOCK_JUMPS
+) -> SimulationClock:
+    """Resumes the world's clock, never behind a time its agents or events already have"""
+    latest_events = await (await get_database()).get_recent_events(world.id, 1)
+
+    return resume_clock(
+        [world.clock_time]
+        + [
+            parse_obj_as(datetime, agent["last_checked_events"])
+            for agent in agents
+            if agent.get("last_checked_events")
+        ]
+        + [parse_obj_as(datetime, event["timestamp"]) for event in latest_events],
+        jumps=jumps,
+    )
 
 
 class WorldContext(BaseModel):
@@ -19,6 +46,28 @@ class WorldContext(BaseModel):
     agents: list[dict]
     locations: list[dict]
     events_manager: EventsManager
+    clock: SimulationClock
+    conversation_histories: dict[str, Any] = {}
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    # Lookups by id, kept in step with agents and locations by update_agent
+    _agents_by_id: dict[str, dict] = PrivateAttr(default_factory=dict)
+    _locations_by_id: dict[str, dict] = PrivateAttr(default_factory=dict)
+    # Agents at each location, keyed by agent id, in the order they arrived
+    _agents_by_location: dict[str, dict[str, dict]] = PrivateAttr(default_factory=dict)
+    _agent_colors: dict[str, LogColor] = PrivateAttr(default_factory=dict)
+    # location_context_string results by location and agent id. A location's
+    # strings are dropped when someone enters or leaves it, or changes their bio
+    _location_context_strings: dict[str, dict[str, str]] = PrivateAttr(
+        default_factory=dict
+    )
+    # Locations each agent may go to by name, dropped when a location is updated
+    _allowed_locations: dict[str, dict[str, Location]] = PrivateAttr(
+        default_factory=dict
+    )
+    _locations_refreshed_at: float = PrivateAttr(default_factory=time.monotonic)
 
     def __init__(
         self,
@@ -32,19 +81,48 @@ class WorldContext(BaseModel):
             agent["id"] = str(agent["id"])
             agent["location_id"] = str(agent["location_id"])
 
-        return super().__init__(
+        super().__init__(
             agents=agents,
             locations=locations,
             world=world,
             events_manager=events_manager,
+            clock=events_manager.clock,
         )
 
+        self.rebuild_indexes()
+
+    def rebuild_indexes(self) -> None:
+        """Indexes the agents and locations. Needed after setting them without __init__"""
+        self._agents_by_id = {str(agent["id"]): agent for agent in self.agents}
+        self._locations_by_id = {
+            str(location["id"]): location for location in self.locations
+        }
+        self._agents_by_location = {}
+        self._location_context_strings = {}
+        self._allowed_locations = {}
+        for agent in self.agents:
+            self._agents_by_location.setdefault(str(agent["location_id"]), {})[
+                str(agent["id"])
+            ] = agent
+        self._assign_colors()
+
+    def _assign_colors(self) -> None:
+        agent_ids = sorted(self._agents_by_id)
+        self._agent_colors = {
+            agent_id: LogColor[f"AGENT_{index % NUM_AGENT_COLORS}"]
+            for index, agent_id in enumerate(agent_ids)
+        }
+
     async def from_data(
         agents: dict,
         locations: dict,
         world: WorldData,
+        clock: Optional[SimulationClock] = None,
     ):
-        events_manager = await EventsManager.from_world_id(world.id)
+        if clock is None:
+            clock = await load_world_clock(world, agents)
+
+        events_manager = await EventsManager.from_world_id(world.id, clock)
 
         return WorldContext(
             agents=agents,
@@ -53,6 +131,13 @@ class WorldContext(BaseModel):
             events_manager=events_manager,
         )
 
+    async def save_clock(self) -> None:
+        """Records the clock's time on the world, so it resumes from there after a restart"""
+        self.world.clock_time = self.clock.now()
+        await write_buffer.update(
+            Tables.Worlds, self.world.id, {"clock_time": self.world.clock_time.isoformat()}
+        )
+
     async def add_event(self, event: Event) -> None:
         """Adds an event in the current step to the DB and local object"""
 
@@ -72,56 +157,89 @@ class WorldContext(BaseModel):
         await database.insert(Tables.Events, event.db_dict())
 
         # Add event to local events list
-        self.events_manager.recent_events.append(event)
+        self.events_manager.add_event(event)
 
         return event
 
     def get_agent_dict_from_id(self, agent_id: UUID | str) -> dict:
-        # get agent
         try:
-            agent = [
-                agent for agent in self.agents if str(agent["id"]) == str(agent_id)
-            ][0]
-        except IndexError:
+            return self._agents_by_id[str(agent_id)]
+        except KeyError:
             raise Exception(f"Could not find agent with id {agent_id}")
 
-        return agent
-
     def get_agents_at_location(self, location_id: str) -> list[dict]:
-        return [a for a in self.agents if str(a["location_id"]) == str(location_id)]
+        return list(self._agents_by_location.get(str(location_id), {}).values())
 
     def get_location_from_agent_id(self, agent_id: UUID | str) -> dict:
         agent = self.get_agent_dict_from_id(agent_id)
-        try:
-            location = [
-                location
-                for location in self.locations
-                if str(location["id"]) == str(agent["location_id"])
-            ][0]
-        except IndexError:
-            raise Exception(f"Could not find location with id {agent['location_id']}")
-
-        return location
+        return self.get_location_from_location_id(agent["location_id"])
 
     def get_location_from_location_id(self, location_id: UUID | str) -> dict:
         try:
-            location = [
-                location
-                for location in self.locations
-                if str(location["id"]) == str(location_id)
-            ][0]
-        except IndexError:
+            return self._locations_by_id[str(location_id)]
+        except KeyError:
             raise Exception(f"Could not find location with id {location_id}")
 
-        return location
+    def get_allowed_locations(self, agent_id: UUID | str) -> dict[str, Location]:
+        """Locations the agent is allowed to be in, by name.
+        Locations with no allowed agents are open to everyone"""
+        agent_id = str(agent_id)
+
+        if agent_id not in self._allowed_locations:
+            self._allowed_locations[agent_id] = {
+                location["name"]: Location(**location)
+                for location in self.locations
+                if not location.get("allowed_agent_ids")
+                or agent_id in [str(id) for id in location["allowed_agent_ids"]]
+            }
+
+        return self._allowed_locations[agent_id]
+
+    def update_location(self, location: dict):
+        location_id = str(location["id"])
+
+        existing = self._locations_by_id.get(location_id)
+        if existing is None:
+            self.locations.append(location)
+            self._locations_by_id[location_id] = location
+        else:
+            existing.update(location)
+
+        # Permissions or descriptions may have changed
+        self._allowed_locations = {}
+        self._location_context_strings.pop(location_id, None)
+
+    async def refresh_locations(self) -> None:
+        """Rereads the world's locations, at most every LOCATIONS_REFRESH_INTERVAL seconds"""
+        now = time.monotonic()
+        if now - self._locations_refreshed_at < LOCATIONS_REFRESH_INTERVAL:
+            return
+        self._locations_refreshed_at = now
+
+        locations = await (await get_database()).get_by_field(
+            Tables.Locations, "world_id", str(self.world.id)
+        )
+        for location in locations:
+            if self._locations_by_id.get(str(location["id"])) != location:
+                self.update_location(location)
 
     def location_context_string(self, agent_id: UUID | str) -> str:
         if isinstance(agent_id, UUID):
             agent_id = str(agent_id)
 
         # get agent
-        agent = [agent for agent in self.agents if agent["id"] == agent_id][0]
+        agent = self.get_agent_dict_from_id(agent_id)
 
+        cached_strings = self._location_context_strings.setdefault(
+            agent["location_id"], {}
+        )
+        if agent_id not in cached_strings:
+            cached_strings[agent_id] = self._build_location_context_string(agent)
+
+        return cached_strings[agent_id]
+
+    def _build_location_context_string(self, agent: dict) -> str:
+        agent_id = agent["id"]
         agents_at_location = self.get_agents_at_location(agent["location_id"])
 
         # get other agents in this location
@@ -141,26 +259,13 @@ class WorldContext(BaseModel):
         )
 
     def get_agent_color(self, agent_id: UUID | str) -> LogColor:
-        agent_ids = sorted([str(agent["id"]) for agent in self.agents], key=str)
-
-        color = f"AGENT_{agent_ids.index(str(agent_id)) % NUM_AGENT_COLORS}"
-        return LogColor[color]
+        return self._agent_colors[str(agent_id)]
 
     def get_location_name(self, location_id: UUID | str):
         return self.get_location_from_location_id(location_id)["name"]
 
     def get_channel_id(self, location_id: UUID | str):
-        # get location
-        try:
-            location = [
-                location
-                for location in self.locations
-                if str(location["id"]) == str(location_id)
-            ][0]
-        except IndexError:
-            raise Exception(f"Could not find location with id {location_id}")
-
-        return location["channel_id"]
+        return self.get_location_from_location_id(location_id)["channel_id"]
 
     def get_agent_location_id(self, agent_id: UUID | str):
         return self.get_agent_dict_from_id(agent_id)["location_id"]
@@ -189,7 +294,34 @@ class WorldContext(BaseModel):
         return self.get_agent_dict_from_id(agent_id)["discord_bot_token"]
 
     def update_agent(self, agent: dict):
-        new_agents = [a for a in self.agents if str(a["id"]) != str(agent["id"])]
-        agent["location_id"] = str(agent["location_id"])
-        new_agents.append(agent)
-        self.agents = new_agents
+        agent_id = str(agent["id"])
+        agent = {**agent, "id": agent_id, "location_id": str(agent["location_id"])}
+
+        existing = self._agents_by_id.get(agent_id)
+        if existing is None:
+            self.agents.append(agent)
+            self._agents_by_id[agent_id] = agent
+            self._agents_by_location.setdefault(agent["location_id"], {})[
+                agent_id
+            ] = agent
+            self._assign_colors()
+            self._location_context_strings.pop(agent["location_id"], None)
+            return
+
+        # Update the agent's dict in place, so the list and the indexes stay in step
+        old_location_id = existing["location_id"]
+        bio_changed = any(
+            field in agent and agent[field] != existing.get(field)
+            for field in ["full_name", "public_bio"]
+        )
+        existing.update(agent)
+
+        if bio_changed or old_location_id != existing["location_id"]:
+            self._location_context_strings.pop(old_location_id, None)
+            self._location_context_strings.pop(existing["location_id"], None)
+
+        if old_location_id != existing["location_id"]:
+            self._agents_by_location.get(old_location_id, {}).pop(agent_id, None)
+            self._agents_by_location.setdefault(existing["location_id"], {})[
+                agent_id
+            ] = existing
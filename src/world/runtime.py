@@ -0,0 +1,94 @@
+import asyncio
+
+from ..utils.database.write_behind import write_buffer
+from ..utils.parameters import (
+    AGENT_CONCURRENCY,
+    SCHEDULER_REPORT_INTERVAL,
+    SNAPSHOT_INTERVAL,
+)
+from .base import World, clear_agents_folder
+from .scheduler import AgentScheduler
+from .snapshot import save_snapshot_and_log, snapshot_periodically
+
+
+class MultiWorldRuntime:
+    """Runs several worlds side by side on one scheduler.
+
+    The worlds share the process, so the LLM and embedding caches, the LLM request
+    limiter and the database connection are shared too. AGENT_CONCURRENCY bounds
+    the steps running across all of them.
+    """
+
+    def __init__(self, worlds: list[World], concurrency: int = AGENT_CONCURRENCY):
+        self.worlds = worlds
+        self.scheduler = AgentScheduler(concurrency=concurrency)
+        self.world_agent_ids: dict[str, list[str]] = {
+            str(world.id): [str(agent.id) for agent in world.agents]
+            for world in worlds
+        }
+
+    @classmethod
+    async def from_ids(cls, world_ids: list[str], **kwargs):
+        worlds = [await World.load(world_id) for world_id in world_ids]
+        return cls(worlds, **kwargs)
+
+    def world_metrics(self, world: World) -> dict[str, float]:
+        """Step counters summed over the world's agents"""
+        stats = [
+            self.scheduler.stats[agent_id]
+            for agent_id in self.world_agent_ids[str(world.id)]
+            if agent_id in self.scheduler.stats
+        ]
+        steps = sum(s.steps for s in stats)
+
+        return {
+            "steps": steps,
+            "idle_steps": sum(s.idle_steps for s in stats),
+            "errors": sum(s.errors for s in stats),
+            "timeouts": sum(s.timeouts for s in stats),
+            "step_rate": sum(s.step_rate for s in stats),
+            "average_step_seconds": (
+                sum(s.total_step_seconds for s in stats) / steps if steps > 0 else 0.0
+            ),
+        }
+
+    def report(self) -> str:
+        lines = []
+        for world in self.worlds:
+            metrics = self.world_metrics(world)
+            lines.append(
+                f"{world.name}: {metrics['step_rate']:.2f} steps/min, "
+                f"{metrics['steps']} steps ({metrics['idle_steps']} idle), "
+                f"{metrics['average_step_seconds']:.1f}s avg, {metrics['errors']} errors "
+                f"({metrics['timeouts']} timed out)"
+            )
+        return "\n".join(lines)
+
+    async def _reporter(self) -> None:
+        while True:
+            await asyncio.sleep(SCHEDULER_REPORT_INTERVAL)
+            print(f"World step rates:\n{self.report()}")
+
+    async def run(self) -> None:
+        clear_agents_folder()
+
+        for world in self.worlds:
+            world.schedule(self.scheduler)
+
+        tasks = [self.scheduler.run(report=False)]
+        if SCHEDULER_REPORT_INTERVAL > 0:
+            tasks.append(self._reporter())
+        if SNAPSHOT_INTERVAL > 0:
+            tasks += [snapshot_periodically(world) for world in self.worlds]
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for world in self.worlds:
+                await world.save_agent_rows()
+                await world.context.save_clock()
+                if SNAPSHOT_INTERVAL > 0:
+                    await save_snapshot_and_log(world)
+            await write_buffer.flush()
+            for world in self.worlds:
+                await world.write_progress_files()
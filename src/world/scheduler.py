@@ -0,0 +1,328 @@
+import asyncio
+import random
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from uuid import UUID
+
+from ..agent.base import Agent
+from ..event.base import Event, EventsManager
+from ..utils.clock import SimulationClock
+from ..utils.database.write_behind import write_buffer
+from ..utils.parameters import (
+    AGENT_CONCURRENCY,
+    IDLE_WAKEUP_INTERVAL,
+    PHASE_DEADLINES,
+    SCHEDULER_JITTER,
+    SCHEDULER_JITTER_MODE,
+    SCHEDULER_REPORT_INTERVAL,
+    STEP_DEADLINE_SECONDS,
+    STEP_RATE_WINDOW,
+)
+
+JITTER_MODES = ["off", "initial", "every"]
+
+
+class AgentStats:
+    """Step counters for a single agent, used to report how fast it is progressing"""
+
+    def __init__(self):
+        self.steps = 0
+        self.idle_steps = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_step_seconds = 0.0
+        self.step_finished_at: deque[float] = deque()
+
+    def record_step(
+        self,
+        seconds: float,
+        failed: bool = False,
+        idle: bool = False,
+        timed_out: bool = False,
+    ) -> None:
+        now = time.monotonic()
+        self.steps += 1
+        self.total_step_seconds += seconds
+        if failed:
+            self.errors += 1
+        if timed_out:
+            self.timeouts += 1
+        if idle:
+            self.idle_steps += 1
+        self.step_finished_at.append(now)
+        while self.step_finished_at and now - self.step_finished_at[0] > STEP_RATE_WINDOW:
+            self.step_finished_at.popleft()
+
+    @property
+    def step_rate(self) -> float:
+        """Steps per minute over the last STEP_RATE_WINDOW seconds"""
+        now = time.monotonic()
+        recent_steps = [t for t in self.step_finished_at if now - t <= STEP_RATE_WINDOW]
+        return len(recent_steps) * 60 / STEP_RATE_WINDOW
+
+    @property
+    def average_step_seconds(self) -> float:
+        return self.total_step_seconds / self.steps if self.steps > 0 else 0.0
+
+
+class AgentScheduler:
+    """Runs agent steps on a fixed number of concurrent slots.
+
+    Agents are picked with stride scheduling: every step an agent takes adds
+    1 / priority to its pass value, and the agent with the lowest pass value runs
+    next. Higher priority agents get proportionally more steps and no agent starves.
+
+    Agents that are idle go to sleep until an event they witness arrives, their
+    current plan's deadline passes or IDLE_WAKEUP_INTERVAL elapses, all measured
+    on the clock of the agent's world. If every agent is asleep, the clocks that
+    jump skip ahead to the earliest wakeup in their world.
+
+    Jitter delays an agent before it becomes ready, so it doesn't hold a slot
+    while it waits.
+
+    Steps and their phases that run past their deadlines are cancelled and count
+    as failed, so a hung LLM call can hold a slot for at most step_deadline seconds.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = AGENT_CONCURRENCY,
+        after_step: Optional[Callable[[Agent], Awaitable[None]]] = None,
+        jitter: float = SCHEDULER_JITTER,
+        jitter_mode: str = SCHEDULER_JITTER_MODE,
+        step_deadline: float = STEP_DEADLINE_SECONDS,
+        phase_deadlines: dict[str, float] = PHASE_DEADLINES,
+    ):
+        if jitter_mode not in JITTER_MODES:
+            raise ValueError(f"Jitter mode must be one of {JITTER_MODES}, got {jitter_mode}")
+
+        self.concurrency = concurrency
+        self.after_step = after_step
+        self.jitter = jitter if jitter_mode != "off" else 0
+        self.jitter_mode = jitter_mode
+        self.step_deadline = step_deadline
+        self.phase_deadlines = phase_deadlines
+        self.agents: dict[str, Agent] = {}
+        self.priorities: dict[str, float] = {}
+        self.passes: dict[str, float] = {}
+        self.stats: dict[str, AgentStats] = {}
+        self.ready: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.sleeping: dict[str, asyncio.TimerHandle] = {}
+        self.wake_at: dict[str, datetime] = {}
+        self.skip_if_idle: dict[str, bool] = {}
+        self._sequence = 0
+        self._running = 0
+
+    def add_agent(self, agent: Agent, priority: float = 1.0) -> None:
+        agent_id = str(agent.id)
+
+        if priority <= 0:
+            raise ValueError(f"Priority must be positive, got {priority}")
+
+        self.agents[agent_id] = agent
+        self.priorities[agent_id] = priority
+        self.stats[agent_id] = AgentStats()
+        self.skip_if_idle[agent_id] = False
+
+        # Start new agents level with the others, so they can't monopolize the slots
+        self.passes[agent_id] = self._current_pass()
+        self._make_ready_after_jitter(agent_id, skip_if_idle=False)
+
+    def remove_agent(self, agent_id: UUID | str) -> None:
+        """Stops scheduling the agent. A step that is already running finishes first"""
+        agent_id = str(agent_id)
+
+        timer = self.sleeping.pop(agent_id, None)
+        if timer is not None:
+            timer.cancel()
+        self.wake_at.pop(agent_id, None)
+
+        for agent_dict in [self.agents, self.priorities, self.passes, self.skip_if_idle]:
+            agent_dict.pop(agent_id, None)
+
+    def set_priority(self, agent_id: UUID | str, priority: float) -> None:
+        if priority <= 0:
+            raise ValueError(f"Priority must be positive, got {priority}")
+        self.priorities[str(agent_id)] = priority
+
+    def watch_events(self, events_manager: EventsManager) -> None:
+        """Wakes sleeping agents when an event they witness arrives"""
+        events_manager.add_listener(self._on_event)
+
+    def _on_event(self, event: Event) -> None:
+        for witness_id in event.witness_ids:
+            if str(witness_id) in self.sleeping:
+                self.wake(witness_id)
+
+    def wake(self, agent_id: UUID | str, skip_if_idle: bool = True) -> None:
+        agent_id = str(agent_id)
+
+        timer = self.sleeping.pop(agent_id, None)
+        self.wake_at.pop(agent_id, None)
+        if timer is None or agent_id not in self.agents:
+            return
+        timer.cancel()
+
+        # Don't let the passes built up while asleep turn into a burst of steps
+        self.passes[agent_id] = max(self.passes[agent_id], self._current_pass())
+        self.skip_if_idle[agent_id] = skip_if_idle
+        self._make_ready(agent_id)
+
+    def _clock(self, agent_id: str) -> SimulationClock:
+        return self.agents[agent_id].context.clock
+
+    def _sleep(self, agent_id: str) -> None:
+        # In simulation seconds
+        delay = IDLE_WAKEUP_INTERVAL
+
+        deadline = self.agents[agent_id].next_wakeup()
+        if deadline is not None:
+            delay = min(delay, (deadline - self._clock(agent_id).now()).total_seconds())
+
+        # Timers and deadlines wake the agent for a full step, even if nothing happened
+        self._wake_later(agent_id, max(delay, 0), skip_if_idle=False)
+
+    def _wake_later(self, agent_id: str, delay: float, skip_if_idle: bool) -> None:
+        """Puts the agent to sleep for delay simulation seconds"""
+        clock = self._clock(agent_id)
+        self.wake_at[agent_id] = clock.now() + timedelta(seconds=delay)
+        self.sleeping[agent_id] = asyncio.get_running_loop().call_later(
+            clock.real_seconds(delay), self.wake, agent_id, skip_if_idle
+        )
+
+    def _make_ready_after_jitter(self, agent_id: str, skip_if_idle: bool) -> None:
+        first_step = self.stats[agent_id].steps == 0
+
+        if self.jitter > 0 and (self.jitter_mode == "every" or first_step):
+            # Jitter is in real seconds, it spreads out requests rather than simulated time
+            self._wake_later(
+                agent_id,
+                random.uniform(0, self.jitter) * self._clock(agent_id).rate,
+                skip_if_idle,
+            )
+        else:
+            self.skip_if_idle[agent_id] = skip_if_idle
+            self._make_ready(agent_id)
+
+    def _jump_if_idle(self) -> None:
+        """Moves each clock that jumps straight to its earliest wakeup if nothing is running"""
+        if self._running > 0 or not self.ready.empty():
+            return
+
+        # Worlds keep their own time, so the earliest wakeup is found per clock
+        earliest: dict[int, str] = {}
+        for agent_id, wake_at in self.wake_at.items():
+            key = id(self._clock(agent_id))
+            if key not in earliest or wake_at < self.wake_at[earliest[key]]:
+                earliest[key] = agent_id
+
+        for agent_id in earliest.values():
+            clock = self._clock(agent_id)
+            if clock.jumps:
+                clock.advance_to(self.wake_at[agent_id])
+                self.wake(agent_id, skip_if_idle=False)
+
+    def _current_pass(self) -> float:
+        awake_passes = [
+            agent_pass
+            for agent_id, agent_pass in self.passes.items()
+            if agent_id not in self.sleeping
+        ]
+        return min(awake_passes, default=0.0)
+
+    def _make_ready(self, agent_id: str) -> None:
+        self._sequence += 1
+        self.ready.put_nowait((self.passes[agent_id], self._sequence, agent_id))
+
+    async def _run_agent_step(self, agent_id: str) -> bool:
+        """Runs one step for the agent, returning False if it was idle"""
+        agent = self.agents[agent_id]
+        started_at = time.monotonic()
+        failed = False
+        timed_out = False
+        did_work = True
+
+        step = agent.run_for_one_step(
+            skip_if_idle=self.skip_if_idle[agent_id],
+            phase_deadlines=self.phase_deadlines,
+        )
+
+        try:
+            if self.step_deadline > 0:
+                did_work = await asyncio.wait_for(step, self.step_deadline)
+            else:
+                did_work = await step
+        except asyncio.TimeoutError as e:
+            failed = True
+            timed_out = True
+            agent._log(
+                "Step Timed Out",
+                str(e) or f"step took longer than {self.step_deadline}s",
+            )
+        except Exception:
+            failed = True
+            agent._log("Step Failed", traceback.format_exc())
+
+        self.stats[agent_id].record_step(
+            time.monotonic() - started_at, failed, idle=not did_work, timed_out=timed_out
+        )
+
+        return did_work
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, agent_id = await self.ready.get()
+
+            if agent_id not in self.agents:
+                continue
+
+            self._running += 1
+            try:
+                did_work = await self._run_agent_step(agent_id)
+
+                if self.after_step is not None and agent_id in self.agents:
+                    await self.after_step(self.agents[agent_id])
+            finally:
+                self._running -= 1
+
+            # Write the step's rows without holding up the next one
+            write_buffer.flush_soon()
+
+            if agent_id in self.agents:
+                self.passes[agent_id] += 1 / self.priorities[agent_id]
+
+                if did_work:
+                    # Check whether the agent is idle before spending LLM calls on it again
+                    self._make_ready_after_jitter(agent_id, skip_if_idle=True)
+                else:
+                    self._sleep(agent_id)
+
+            self._jump_if_idle()
+
+    def step_rates(self) -> dict[str, float]:
+        """Steps per minute for each agent, keyed by agent id"""
+        return {agent_id: stats.step_rate for agent_id, stats in self.stats.items()}
+
+    def report(self) -> str:
+        lines = [
+            f"{self.agents[agent_id].full_name}: {stats.step_rate:.2f} steps/min, "
+            f"{stats.steps} steps ({stats.idle_steps} idle), "
+            f"{stats.average_step_seconds:.1f}s avg, {stats.errors} errors "
+            f"({stats.timeouts} timed out)"
+            for agent_id, stats in self.stats.items()
+        ]
+        return "\n".join(lines)
+
+    async def _reporter(self) -> None:
+        while True:
+            await asyncio.sleep(SCHEDULER_REPORT_INTERVAL)
+            print(f"Scheduler step rates:\n{self.report()}")
+
+    async def run(self, report: Optional[bool] = True) -> None:
+        workers = [self._worker() for _ in range(self.concurrency)]
+        if report and SCHEDULER_REPORT_INTERVAL > 0:
+            workers.append(self._reporter())
+        await asyncio.gather(*workers)
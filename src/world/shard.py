@@ -0,0 +1,310 @@
+import asyncio
+import multiprocessing
+import queue
+import traceback
+from datetime import datetime
+from typing import Any
+
+from src.utils.database.base import Tables
+from src.utils.database.client import database_class, get_database
+from src.utils.database.write_behind import write_buffer
+
+from ..agent.base import Agent
+from ..event.base import Event
+from ..utils.clock import SimulationClock
+from ..utils.parameters import (
+    AGENT_CONCURRENCY,
+    AGENT_PRIORITIES,
+    SIMULATION_CLOCK_JUMPS,
+    SIMULATION_CLOCK_RATE,
+)
+from .base import World, clear_agents_folder
+from .context import WorldData, load_world_clock
+from .scheduler import AgentScheduler
+
+# Messages sent over the bus, as tuples of (kind, shard index, payload)
+EVENT_MESSAGE = "event"  # an event created in a shard, delivered to every other shard
+AGENT_MESSAGE = "agent"  # an agent's row after it moved, so every shard knows where it is
+HANDOFF_MESSAGE = "handoff"  # an agent left the shard's locations
+ADOPT_MESSAGE = "adopt"  # sent by the coordinator, the shard should start running the agent
+STOP_MESSAGE = "stop"  # sent by the coordinator, the shard should save its state and exit
+
+# Seconds a shard waits on its inbox at a time, so the waiting thread never outlives the shard
+INBOX_POLL_SECONDS = 1
+# Seconds the coordinator gives each shard to save its state before terminating it
+SHARD_STOP_SECONDS = 60
+
+# Shards are spawned rather than forked, so they don't inherit the coordinator's DB connection
+shard_context = multiprocessing.get_context("spawn")
+
+
+def partition_locations(
+    locations: list[dict], agents: list[dict], num_shards: int
+) -> list[list[str]]:
+    """Splits the location ids into shards with roughly the same number of agents each"""
+    agent_counts = {str(location["id"]): 0 for location in locations}
+    for agent in agents:
+        if str(agent["location_id"]) in agent_counts:
+            agent_counts[str(agent["location_id"])] += 1
+
+    shards: list[list[str]] = [[] for _ in range(num_shards)]
+    shard_sizes = [0] * num_shards
+
+    # Place the busiest locations first, each on the least loaded shard
+    for location_id, count in sorted(
+        agent_counts.items(), key=lambda item: item[1], reverse=True
+    ):
+        index = shard_sizes.index(min(shard_sizes))
+        shards[index].append(location_id)
+        shard_sizes[index] += count
+
+    return [shard for shard in shards if len(shard) > 0]
+
+
+class ShardWorker:
+    """Runs the agents at one shard's locations and exchanges events and agents over the bus"""
+
+    def __init__(
+        self,
+        world_id: str,
+        index: int,
+        location_ids: list[str],
+        inbox: multiprocessing.Queue,
+        bus: multiprocessing.Queue,
+        clock_anchor: tuple[datetime, float],
+    ):
+        self.world_id = world_id
+        self.index = index
+        # Every shard runs the coordinator's clock, so their timestamps agree
+        self.clock = SimulationClock.from_anchor(
+            *clock_anchor, rate=SIMULATION_CLOCK_RATE
+        )
+        self.location_ids = set(location_ids)
+        self.inbox = inbox
+        self.bus = bus
+        self.world: World = None
+        self.scheduler = AgentScheduler(
+            concurrency=AGENT_CONCURRENCY, after_step=self._after_step
+        )
+        self.agent_locations: dict[str, str] = {}
+
+    def _publish_event(self, event: Event) -> None:
+        self.bus.put((EVENT_MESSAGE, self.index, event.db_dict()))
+
+    async def _after_step(self, agent: Agent) -> None:
+        agent_id = str(agent.id)
+        location_id = str(agent.location.id)
+
+        if self.agent_locations.get(agent_id) == location_id:
+            return
+
+        self.agent_locations[agent_id] = location_id
+        self.bus.put((AGENT_MESSAGE, self.index, agent._db_dict()))
+
+        if location_id not in self.location_ids:
+            self.scheduler.remove_agent(agent_id)
+            self.world.agents = [a for a in self.world.agents if a.id != agent.id]
+            await agent.write_progress_to_file(force=True)
+            # The adopting shard loads the agent from the database
+            await write_buffer.flush()
+            self.bus.put((HANDOFF_MESSAGE, self.index, (agent_id, location_id)))
+
+    async def _adopt(self, agent_id: str) -> None:
+        rows = await (await get_database()).get_by_id(Tables.Agents, agent_id)
+
+        if len(rows) == 0:
+            print(f"Shard {self.index} could not find agent {agent_id} to adopt")
+            return
+
+        agent = await Agent.from_db_dict(
+            rows[0], self.world.locations, context=self.world.context
+        )
+
+        self.world.agents.append(agent)
+        self.agent_locations[agent_id] = str(agent.location.id)
+        self.scheduler.add_agent(
+            agent, priority=AGENT_PRIORITIES.get(agent_id, 1.0)
+        )
+
+    async def _read_inbox(self) -> None:
+        """Handles messages from the coordinator until it asks the shard to stop"""
+        events_manager = self.world.context.events_manager
+
+        while True:
+            try:
+                kind, _, payload = await asyncio.to_thread(
+                    self.inbox.get, True, INBOX_POLL_SECONDS
+                )
+            except queue.Empty:
+                continue
+
+            if kind == STOP_MESSAGE:
+                return
+            elif kind == EVENT_MESSAGE:
+                event = Event.from_db_dict(payload)
+                known_event_ids = set(e.id for e in events_manager.recent_events)
+                if event.id not in known_event_ids:
+                    events_manager.add_event(event, publish=False)
+            elif kind == AGENT_MESSAGE:
+                self.world.context.update_agent(payload)
+            elif kind == ADOPT_MESSAGE:
+                await self._adopt(payload)
+
+    async def run(self) -> None:
+        self.world = await World.from_id(
+            self.world_id, location_ids=list(self.location_ids), clock=self.clock
+        )
+
+        for agent in self.world.agents:
+            self.agent_locations[str(agent.id)] = str(agent.location.id)
+
+        self.world.context.events_manager.add_publisher(self._publish_event)
+        self.world.schedule(self.scheduler)
+
+        print(
+            f"Shard {self.index} running {len(self.world.agents)} agents "
+            f"at {len(self.location_ids)} locations"
+        )
+
+        tasks = [
+            asyncio.create_task(self.scheduler.run()),
+            asyncio.create_task(self._read_inbox()),
+        ]
+        try:
+            # The inbox reader returns when the shard is stopped, the scheduler only if it fails
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            await self.world.save_agent_rows()
+            await write_buffer.flush()
+            await self.world.write_progress_files()
+            await (await get_database()).close()
+
+
+def run_shard(
+    world_id: str,
+    index: int,
+    location_ids: list[str],
+    inbox: multiprocessing.Queue,
+    bus: multiprocessing.Queue,
+    clock_anchor: tuple[datetime, float],
+) -> None:
+    # Shards share the coordinator's database, which it has already migrated
+    database_class.worker = True
+
+    try:
+        asyncio.run(
+            ShardWorker(world_id, index, location_ids, inbox, bus, clock_anchor).run()
+        )
+    except Exception:
+        print(f"Shard {index} crashed:\n{traceback.format_exc()}")
+    finally:
+        # Don't hold up the exit on messages the coordinator will no longer read
+        bus.cancel_join_thread()
+
+
+class ShardedWorldRuntime:
+    """Runs one world across several processes, each owning a subset of its locations.
+
+    The coordinator relays events and agent moves between the shards, and hands an
+    agent over to the shard that owns its new location when it moves. It owns the
+    world's clock and starts every shard on it. The clock doesn't jump, as no
+    shard knows whether the agents in the others are idle.
+    """
+
+    def __init__(self, world_id: str, num_shards: int):
+        self.world_id = str(world_id)
+        self.num_shards = num_shards
+        self.location_shards: dict[str, int] = {}
+        self.inboxes: list[multiprocessing.Queue] = []
+        self.bus: multiprocessing.Queue = shard_context.Queue()
+        self.processes: list[multiprocessing.Process] = []
+
+    def _route(self, message: tuple[str, int, Any]) -> None:
+        kind, sender, payload = message
+
+        if kind in [EVENT_MESSAGE, AGENT_MESSAGE]:
+            for index, inbox in enumerate(self.inboxes):
+                if index != sender:
+                    inbox.put(message)
+        elif kind == HANDOFF_MESSAGE:
+            agent_id, location_id = payload
+            owner = self.location_shards.get(location_id)
+            if owner is None:
+                print(f"No shard owns location {location_id}, agent {agent_id} is lost")
+                return
+            self.inboxes[owner].put((ADOPT_MESSAGE, sender, agent_id))
+
+    async def _stop_shards(self) -> None:
+        """Lets every shard save its state and exit, and terminates those that don't in time"""
+        for inbox in self.inboxes:
+            inbox.put((STOP_MESSAGE, -1, None))
+
+        for index, process in enumerate(self.processes):
+            await asyncio.to_thread(process.join, SHARD_STOP_SECONDS)
+            if process.is_alive():
+                print(f"Shard {index} did not stop in {SHARD_STOP_SECONDS}s, terminating it")
+                process.terminate()
+
+        for inbox in self.inboxes:
+            inbox.cancel_join_thread()
+
+    async def run(self) -> None:
+        database = await get_database()
+        locations = await database.get_by_field(
+            Tables.Locations, "world_id", self.world_id
+        )
+        agents = await database.get_by_field(Tables.Agents, "world_id", self.world_id)
+        world = WorldData(**(await database.get_by_id(Tables.Worlds, self.world_id))[0])
+
+        if SIMULATION_CLOCK_JUMPS:
+            print("The simulation clock doesn't jump when a world runs across shards")
+        clock = await load_world_clock(world, agents, jumps=False)
+        clock_anchor = clock.anchor()
+
+        shards = partition_locations(locations, agents, self.num_shards)
+
+        for index, location_ids in enumerate(shards):
+            for location_id in location_ids:
+                self.location_shards[location_id] = index
+
+            inbox = shard_context.Queue()
+            self.inboxes.append(inbox)
+            self.processes.append(
+                shard_context.Process(
+                    target=run_shard,
+                    args=(
+                        self.world_id,
+                        index,
+                        location_ids,
+                        inbox,
+                        self.bus,
+                        clock_anchor,
+                    ),
+                )
+            )
+
+        clear_agents_folder()
+
+        for process in self.processes:
+            process.start()
+
+        try:
+            while any(process.is_alive() for process in self.processes):
+                try:
+                    message = await asyncio.to_thread(self.bus.get, True, 1)
+                except queue.Empty:
+                    continue
+                self._route(message)
+        finally:
+            await self._stop_shards()
+
+            await write_buffer.update(
+                Tables.Worlds, self.world_id, {"clock_time": clock.now().isoformat()}
+            )
+            await write_buffer.flush()
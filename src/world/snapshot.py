@@ -0,0 +1,328 @@
+import asyncio
+import os
+import pickle
+import traceback
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Optional
+from uuid import UUID, uuid4
+
+import numpy as np
+import pytz
+from pydantic import parse_obj_as
+
+from ..agent.base import Agent
+from ..agent.message import AgentMessage, track_conversation_histories
+from ..agent.plans import SinglePlan
+from ..event.base import Event, EventsManager
+from ..memory.base import SingleMemory
+from ..utils.database.base import Tables
+from ..utils.database.client import get_database
+from ..utils.parameters import SNAPSHOT_DIRECTORY, SNAPSHOT_INTERVAL
+from .context import WorldContext, WorldData, load_world_clock
+
+if TYPE_CHECKING:
+    from .base import World
+
+# Bump when the layout of the state changes, older snapshots are then ignored
+SNAPSHOT_VERSION = 1
+STATE_FILE = "state.pickle"
+
+# Everything on an agent except its memories, plans, location and runtime objects
+AGENT_FIELDS = [
+    "id",
+    "full_name",
+    "private_bio",
+    "public_bio",
+    "directives",
+    "last_checked_events",
+    "last_summarized_activity",
+    "authorized_tools",
+    "world_id",
+    "notes",
+    "discord_bot_token",
+    "recent_activity",
+]
+
+PLAN_FIELDS = [
+    "id",
+    "description",
+    "max_duration_hrs",
+    "created_at",
+    "agent_id",
+    "stop_condition",
+    "status",
+    "scratchpad",
+    "completed_at",
+]
+
+
+def snapshot_directory(world_id: UUID | str) -> str:
+    return os.path.join(SNAPSHOT_DIRECTORY, str(world_id))
+
+
+def snapshot_exists(world_id: UUID | str) -> bool:
+    return os.path.exists(os.path.join(snapshot_directory(world_id), STATE_FILE))
+
+
+def _capture(world: "World", embeddings_file: str) -> tuple[bytes, np.ndarray]:
+    """Pickles the world's state and gathers its embeddings into one matrix.
+
+    Nothing here awaits, so no agent can change the state halfway through. The state
+    is pickled here rather than in the writing thread, as the copies are shallow.
+    """
+    embeddings: list[np.ndarray] = []
+    agents = []
+
+    for agent in world.agents:
+        memories = []
+        for memory in agent.memories:
+            memories.append(
+                (
+                    memory.id,
+                    memory.type,
+                    memory.description,
+                    memory.importance,
+                    memory.created_at,
+                    memory.last_accessed,
+                    list(memory.related_memory_ids),
+                    len(embeddings),
+                )
+            )
+            embeddings.append(memory.embedding)
+
+        plans = [
+            {
+                **{field: getattr(plan, field) for field in PLAN_FIELDS},
+                "location_id": str(plan.location.id) if plan.location else None,
+                "related_event_id": plan.related_message.event_id
+                if plan.related_message
+                else None,
+            }
+            for plan in agent.plans
+        ]
+
+        agents.append(
+            {
+                **{field: getattr(agent, field) for field in AGENT_FIELDS},
+                "location_id": str(agent.location.id),
+                "memories": memories,
+                "plans": plans,
+            }
+        )
+
+    state = {
+        "version": SNAPSHOT_VERSION,
+        "taken_at": world.context.clock.now(),
+        "world": {"id": str(world.id), "name": world.name},
+        "locations": list(world.locations),
+        "context_agents": [dict(agent) for agent in world.context.agents],
+        "context_locations": [dict(location) for location in world.context.locations],
+        "events": list(world.context.events_manager.recent_events),
+        "conversation_histories": dict(world.context.conversation_histories),
+        "agents": agents,
+        # The state names its embedding file, so swapping in the state file switches both at once
+        "embeddings_file": embeddings_file,
+    }
+
+    matrix = (
+        np.stack(embeddings).astype(np.float32)
+        if len(embeddings) > 0
+        else np.zeros((0, 0), dtype=np.float32)
+    )
+
+    return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), matrix
+
+
+def _write(
+    directory: str, state: bytes, embeddings_file: str, embeddings: np.ndarray
+) -> None:
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, embeddings_file), "wb") as f:
+        np.save(f, embeddings)
+        f.flush()
+        os.fsync(f.fileno())
+
+    temp_path = os.path.join(directory, f"{STATE_FILE}.tmp")
+    with open(temp_path, "wb") as f:
+        f.write(state)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, os.path.join(directory, STATE_FILE))
+
+    for name in os.listdir(directory):
+        if name.startswith("embeddings-") and name != embeddings_file:
+            os.remove(os.path.join(directory, name))
+
+
+async def save_snapshot(world: "World") -> None:
+    embeddings_file = f"embeddings-{uuid4().hex}.npy"
+    state, embeddings = _capture(world, embeddings_file)
+    await asyncio.to_thread(
+        _write, snapshot_directory(world.id), state, embeddings_file, embeddings
+    )
+
+
+async def save_snapshot_and_log(world: "World") -> None:
+    try:
+        await save_snapshot(world)
+    except Exception:
+        print(f"Could not snapshot {world.name}:\n{traceback.format_exc()}")
+
+
+async def snapshot_periodically(
+    world: "World", interval: int = SNAPSHOT_INTERVAL
+) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        await save_snapshot_and_log(world)
+
+
+def _utc(value: Any) -> datetime:
+    when = parse_obj_as(datetime, value)
+    return when if when.tzinfo is not None else pytz.utc.localize(when)
+
+
+async def _is_current(state: dict[str, Any]) -> bool:
+    """Whether the DB holds nothing the snapshot doesn't, e.g. after a crash or a reseed"""
+    taken_at = _utc(state["taken_at"])
+    database = await get_database()
+
+    agents = await database.get_by_field(
+        Tables.Agents, "world_id", state["world"]["id"]
+    )
+    agent_ids = [str(agent["id"]) for agent in agents]
+    if set(agent_ids) != set(str(agent["id"]) for agent in state["agents"]):
+        return False
+
+    if any(
+        agent["last_checked_events"] and _utc(agent["last_checked_events"]) > taken_at
+        for agent in agents
+    ):
+        return False
+
+    memory_ids = set(
+        str(memory[0]) for agent in state["agents"] for memory in agent["memories"]
+    )
+    for memory in await database.get_latest_memories(agent_ids, 1):
+        if str(memory["id"]) not in memory_ids or _utc(memory["created_at"]) > taken_at:
+            return False
+
+    return True
+
+
+async def restore_snapshot(world_id: UUID | str) -> Optional[dict[str, Any]]:
+    """Rebuilds a world's state from its snapshot, without validating or parsing anything.
+
+    Returns the World fields, or None if there is no usable snapshot.
+    """
+    directory = snapshot_directory(world_id)
+    if not snapshot_exists(world_id):
+        return None
+
+    with open(os.path.join(directory, STATE_FILE), "rb") as f:
+        state = pickle.load(f)
+
+    if state.get("version") != SNAPSHOT_VERSION:
+        print(f"Ignoring snapshot of world {world_id} with an old format")
+        return None
+
+    if not await _is_current(state):
+        print(f"Ignoring snapshot of world {world_id}, the database has changed since")
+        return None
+
+    # Memory embeddings are views into the mapped file, they're only paged in when used
+    embeddings = np.load(
+        os.path.join(directory, state["embeddings_file"]), mmap_mode="r"
+    )
+
+    world = WorldData.construct(**state["world"], clock_time=state["taken_at"])
+    clock = await load_world_clock(world, state["context_agents"])
+
+    events_manager = EventsManager.construct(
+        recent_events=state["events"],
+        world_id=state["world"]["id"],
+        last_refresh=state["taken_at"],
+        refresh_lock=asyncio.Lock(),
+        listeners=[],
+        publishers=[],
+        clock=clock,
+    )
+    context = WorldContext.construct(
+        world=world,
+        agents=state["context_agents"],
+        locations=state["context_locations"],
+        events_manager=events_manager,
+        clock=clock,
+        conversation_histories=state["conversation_histories"],
+    )
+    context.rebuild_indexes()
+    track_conversation_histories(context)
+
+    locations = {str(location.id): location for location in state["locations"]}
+    events = {event.id: event for event in state["events"]}
+
+    agents = []
+    for agent_state in state["agents"]:
+        memories = [
+            SingleMemory.construct(
+                id=id,
+                agent_id=agent_state["id"],
+                type=type,
+                description=description,
+                embedding=embeddings[row],
+                importance=importance,
+                created_at=created_at,
+                last_accessed=last_accessed,
+                related_memory_ids=related_memory_ids,
+            )
+            for (
+                id,
+                type,
+                description,
+                importance,
+                created_at,
+                last_accessed,
+                related_memory_ids,
+                row,
+            ) in agent_state["memories"]
+        ]
+
+        plans = []
+        for plan_state in agent_state["plans"]:
+            related_message = None
+            related_event_id = plan_state["related_event_id"]
+            if related_event_id is not None:
+                related_event = events.get(related_event_id) or await Event.from_id(
+                    related_event_id
+                )
+                related_message = AgentMessage.from_event(related_event, context)
+
+            plans.append(
+                SinglePlan.construct(
+                    **{field: plan_state[field] for field in PLAN_FIELDS},
+                    location=locations.get(plan_state["location_id"]),
+                    related_message=related_message,
+                )
+            )
+
+        agents.append(
+            Agent.construct(
+                **{field: agent_state[field] for field in AGENT_FIELDS},
+                location=locations[agent_state["location_id"]],
+                context=context,
+                memories=memories,
+                plans=plans,
+            )
+        )
+
+    # Catch up on events written after the snapshot was taken
+    await events_manager.refresh_events()
+
+    return {
+        "id": UUID(state["world"]["id"]),
+        "name": state["world"]["name"],
+        "locations": list(locations.values()),
+        "agents": agents,
+        "context": context,
+    }
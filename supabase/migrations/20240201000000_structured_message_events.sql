@@ -0,0 +1,16 @@
+-- Store the sender, recipients and content of message events as columns,
+-- so messages no longer need to be parsed back out of the description.
+
+alter table "public"."Events" add column "sender_id" uuid;
+
+alter table "public"."Events" add column "recipient_ids" uuid[];
+
+alter table "public"."Events" add column "content" text;
+
+alter table "public"."Events" add constraint "Events_sender_id_fkey" FOREIGN KEY (sender_id) REFERENCES "Agents"(id) ON DELETE CASCADE not valid;
+
+alter table "public"."Events" validate constraint "Events_sender_id_fkey";
+
+create index "Events_sender_id_idx" on "public"."Events" using btree ("sender_id");
+
+create index "Events_recipient_ids_idx" on "public"."Events" using gin ("recipient_ids");
@@ -0,0 +1,4 @@
+-- Store each world's simulation clock, so it resumes where it left off
+-- when the simulation runs faster than real time.
+
+alter table "public"."Worlds" add column "clock_time" timestamp with time zone;
@@ -0,0 +1,64 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+pytest.importorskip("hyperdb")
+
+import aiosqlite
+
+from src.utils.database.base import Tables
+from src.utils.database.sqlite import SqliteDatabase, dict_factory
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    connection.execute(
+        "CREATE TABLE events (id TEXT, witness_ids TEXT, metadata TEXT, content TEXT)"
+    )
+    connection.row_factory = dict_factory
+    yield connection
+    connection.close()
+
+
+@pytest.mark.parametrize("content", ["[laughs] fine", "{not json", "{}", "[1, 2]"])
+def test_free_text_starting_with_brackets_is_not_decoded(connection, content):
+    connection.execute(
+        "INSERT INTO events VALUES (?, ?, ?, ?)",
+        ("1", json.dumps(["a", "b"]), json.dumps({"discord_id": "2"}), content),
+    )
+
+    row = connection.execute("SELECT * FROM events").fetchone()
+
+    assert row["content"] == content
+    assert row["witness_ids"] == ["a", "b"]
+    assert row["metadata"] == {"discord_id": "2"}
+
+
+def test_update_leaves_the_callers_dict_alone():
+    data = {"scratchpad": [{"step": 1}], "status": "in_progress"}
+
+    async def run():
+        database = SqliteDatabase()
+        database.client = await aiosqlite.connect(":memory:")
+        database.client.row_factory = dict_factory
+        try:
+            await database.client.execute(
+                "CREATE TABLE Plans (id TEXT, scratchpad TEXT, status TEXT)"
+            )
+            await database.client.execute(
+                "INSERT INTO Plans VALUES ('1', '[]', 'to_do')"
+            )
+            await database.update(Tables.Plans, "1", data)
+            return await database.get_by_id(Tables.Plans, "1")
+        finally:
+            await database.client.close()
+
+    rows = asyncio.run(run())
+
+    assert data == {"scratchpad": [{"step": 1}], "status": "in_progress"}
+    assert rows[0]["scratchpad"] == [{"step": 1}]
+    assert rows[0]["status"] == "in_progress"
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pydantic")
+pytest.importorskip("dotenv")
+pytest.importorskip("aiosqlite")
+pytest.importorskip("hyperdb")
+
+from src.utils.database import write_behind
+from src.utils.database.base import PartialWriteError, Tables
+from src.utils.database.write_behind import WriteBehindBuffer
+
+
+class FakeDatabase:
+    """Records each batch, and fails the ones the test asks it to"""
+
+    def __init__(self, failures=None):
+        self.batches = []
+        self.failures = failures or []
+
+    async def write_batch(self, inserts, upserts, updates):
+        if self.failures:
+            failure = self.failures.pop(0)
+            if failure is not None:
+                raise failure(inserts, upserts, updates)
+        self.batches.append((inserts, upserts, updates))
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+
+    async def get_database():
+        return database
+
+    monkeypatch.setattr(write_behind, "get_database", get_database)
+    return database
+
+
+async def fill(buffer):
+    await buffer.insert(Tables.Memories, {"id": "m1"})
+    await buffer.insert(Tables.Memories, {"id": "m2"})
+    await buffer.upsert(Tables.Plans, {"id": "p1", "status": "to_do"})
+    await buffer.update(Tables.Agents, "a1", {"notes": "first"})
+
+
+def test_writes_to_the_same_row_are_merged(database):
+    async def run():
+        buffer = WriteBehindBuffer(mode="step")
+        await fill(buffer)
+        await buffer.upsert(Tables.Plans, {"id": "p1", "status": "done"})
+        await buffer.update(Tables.Agents, "a1", {"notes": "second", "bio": "x"})
+        await buffer.flush()
+
+    asyncio.run(run())
+
+    assert database.batches == [
+        (
+            {Tables.Memories: [{"id": "m1"}, {"id": "m2"}]},
+            {Tables.Plans: [{"id": "p1", "status": "done"}]},
+            {Tables.Agents: {"a1": {"notes": "second", "bio": "x"}}},
+        )
+    ]
+
+
+def test_failed_flush_retries_only_the_unwritten_rows(database):
+    def fail_after_inserts(inserts, upserts, updates):
+        return PartialWriteError({}, upserts, updates)
+
+    database.failures = [fail_after_inserts]
+
+    async def run():
+        buffer = WriteBehindBuffer(mode="step", max_retries=3)
+        await fill(buffer)
+        with pytest.raises(PartialWriteError):
+            await buffer.flush()
+
+        # Writes buffered since the failure win over the retried ones
+        await buffer.update(Tables.Agents, "a1", {"notes": "newer"})
+        await buffer.flush()
+        return buffer
+
+    buffer = asyncio.run(run())
+
+    assert database.batches == [
+        (
+            {},
+            {Tables.Plans: [{"id": "p1", "status": "to_do"}]},
+            {Tables.Agents: {"a1": {"notes": "newer"}}},
+        )
+    ]
+    assert not buffer.pending
+    assert buffer.failed_flushes == 0
+
+
+def test_rows_that_keep_failing_are_dropped(database):
+    def fail(inserts, upserts, updates):
+        return RuntimeError("database is down")
+
+    # Both flushes fail, then only the plan fails when written on its own
+    database.failures = [fail, fail, None, None, fail, None]
+
+    async def run():
+        buffer = WriteBehindBuffer(mode="step", max_retries=2)
+        await fill(buffer)
+        with pytest.raises(RuntimeError):
+            await buffer.flush()
+        await buffer.flush()
+        return buffer
+
+    buffer = asyncio.run(run())
+
+    assert database.batches == [
+        ({Tables.Memories: [{"id": "m1"}]}, {}, {}),
+        ({Tables.Memories: [{"id": "m2"}]}, {}, {}),
+        ({}, {}, {Tables.Agents: {"a1": {"notes": "first"}}}),
+    ]
+    assert not buffer.pending
+    assert buffer.failed_flushes == 0